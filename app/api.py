@@ -0,0 +1,277 @@
+"""Headless HTTP API for persona generation, rendering and avatars.
+
+Runs next to (or without) the Streamlit app, on the same services:
+
+    uvicorn app.api:app --port 8000 --workers 1
+
+Blocking calls (Gemini, image APIs) run on a thread pool with the caller tagged
+for fair rate limiting, CPU-bound rendering runs on a process pool.
+"""
+import asyncio
+import base64
+import binascii
+import json
+import math
+import multiprocessing
+import os
+import re
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from urllib.parse import quote
+
+import requests
+from fastapi import Body, FastAPI, HTTPException, Request
+from fastapi.responses import HTMLResponse, JSONResponse, Response
+
+from app.models.persona import Persona
+from app.services.avatar_providers import PROVIDERS, AvatarGenerationError, avatar_cache_stats, provider_health
+from app.services.http_client import http_metrics
+from app.services.llm_client import llm_stats, pick_seed
+from app.services.pdf_export import pdf_cache_stats
+from app.services.persona_generator import generate_persona_with_avatar, start_avatar_generation
+from app.services.photo_pool import photo_pool
+from app.services.rate_limiter import RateLimitTimeout, rate_limit_context, rate_limit_metrics
+from app.services.rendering import persona_pdf, preview_html
+from app.utils.config import get_float_setting, get_int_setting, get_setting
+from app.utils.images import data_uri_stats, image_mime, thumbnail_cache_stats
+from app.utils.templates import TEMPLATES
+
+SECRET_KEYS = ("STABILITY_API_KEY", "HUGGINGFACE_TOKEN")
+# Same limit as the builder's photo upload
+MAX_PHOTO_BYTES = 1 * 1024 * 1024
+
+_render_pool = None
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global _render_pool
+    loop = asyncio.get_running_loop()
+    # asyncio.to_thread() runs on the default executor, size it for slow upstream calls
+    loop.set_default_executor(ThreadPoolExecutor(
+        max_workers=get_int_setting("API_IO_WORKERS", 32), thread_name_prefix="api-io"))
+    # spawn, not fork: this process already runs threads (job runner, photo pool)
+    _render_pool = ProcessPoolExecutor(
+        max_workers=get_int_setting("API_RENDER_WORKERS", os.cpu_count() or 2),
+        mp_context=multiprocessing.get_context("spawn"))
+    photo_pool.warm()
+    try:
+        yield
+    finally:
+        _render_pool.shutdown(cancel_futures=True)
+
+
+app = FastAPI(title="User Persona Builder API", lifespan=lifespan)
+
+
+def service_secrets():
+    return {key: get_setting(key) for key in SECRET_KEYS}
+
+
+def client_id(request):
+    # Fair queueing for the shared Gemini/image quotas is per client
+    return request.headers.get("X-Client-Id") or (request.client.host if request.client else None)
+
+
+async def run_blocking(request, fn, *args, **kwargs):
+    """Run a blocking call on the I/O pool, tagged with the caller for the rate limiters"""
+    session = client_id(request)
+
+    def call():
+        with rate_limit_context(session=session):
+            return fn(*args, **kwargs)
+
+    return await asyncio.to_thread(call)
+
+
+async def run_render(fn, *args):
+    """Run a CPU-bound render on the process pool"""
+    return await asyncio.get_running_loop().run_in_executor(_render_pool, fn, *args)
+
+
+async def wait_for_avatar(job):
+    """Image bytes of a finished avatar job, raises its error or a 504 on timeout.
+
+    Waits on a future the job resolves, so a slow avatar holds no I/O thread.
+    """
+    loop = asyncio.get_running_loop()
+    finished = loop.create_future()
+
+    def resolve():
+        if not finished.done():
+            finished.set_result(None)
+
+    def on_done(_job):
+        try:
+            loop.call_soon_threadsafe(resolve)
+        except RuntimeError:  # The loop shut down meanwhile
+            pass
+
+    job.add_done_callback(on_done)
+    try:
+        await asyncio.wait_for(finished, get_float_setting("AVATAR_JOB_DEADLINE", 300.0))
+    except asyncio.TimeoutError:
+        raise HTTPException(504, "Avatar generation timed out")
+    if job.status != "done":
+        if isinstance(job.error, (AvatarGenerationError, requests.exceptions.RequestException)):
+            raise job.error
+        raise HTTPException(502, f"Avatar generation failed: {job.error}")
+    return job.result
+
+
+def encode_photo(photo):
+    return base64.b64encode(photo).decode("ascii") if photo else None
+
+
+def decode_photo(value):
+    if not value:
+        return None
+    if not isinstance(value, str):
+        raise HTTPException(422, "photo must be base64 encoded")
+    try:
+        photo = base64.b64decode(value, validate=True)
+    except (binascii.Error, ValueError):
+        raise HTTPException(422, "photo must be base64 encoded")
+    if len(photo) > MAX_PHOTO_BYTES:
+        raise HTTPException(413, "photo must be under 1MB")
+    return photo
+
+
+def normalize_persona(fields):
+    """Persona fields in the builder's export shape, 422 when they can't be parsed"""
+    if not isinstance(fields, dict):
+        raise HTTPException(422, "persona must be an object")
+    try:
+        return Persona.from_dict(fields).to_dict()
+    except (TypeError, ValueError) as e:
+        raise HTTPException(422, f"Invalid persona: {e}")
+
+
+def parse_render_request(payload):
+    """(template, normalized persona dict, photo bytes) from a render request body"""
+    template = payload.get("template", "basic")
+    if template not in TEMPLATES:
+        raise HTTPException(422, f"template must be one of: {', '.join(TEMPLATES)}")
+    return template, normalize_persona(payload.get("persona")), decode_photo(payload.get("photo"))
+
+
+def content_disposition(name, extension):
+    """attachment header with an ASCII filename plus the exact UTF-8 one (RFC 5987)"""
+    ascii_name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii")
+    slug = re.sub(r"[^a-z0-9]+", "_", ascii_name.lower()).strip("_") or "persona"
+    utf8_name = quote(f"{name.strip() or 'persona'}.{extension}", safe="")
+    return f"attachment; filename=\"{slug}.{extension}\"; filename*=UTF-8''{utf8_name}"
+
+
+def check_provider(provider):
+    if provider is not None and provider not in PROVIDERS:
+        raise HTTPException(422, f"avatar must be one of: {', '.join(PROVIDERS)}")
+
+
+@app.exception_handler(RateLimitTimeout)
+async def rate_limit_timeout(request, error):
+    return JSONResponse({"detail": str(error)}, status_code=429,
+                        headers={"Retry-After": str(math.ceil(error.estimated_wait))})
+
+
+@app.exception_handler(AvatarGenerationError)
+async def avatar_failed(request, error):
+    # Still worth retrying when a provider only asked us to wait (model loading)
+    if error.retry_after is not None:
+        return JSONResponse({"detail": str(error)}, status_code=503,
+                            headers={"Retry-After": str(math.ceil(error.retry_after))})
+    return JSONResponse({"detail": str(error)}, status_code=502)
+
+
+@app.exception_handler(json.JSONDecodeError)
+async def invalid_model_output(request, error):
+    return JSONResponse({"detail": "Gemini returned invalid JSON"}, status_code=502)
+
+
+@app.exception_handler(requests.exceptions.RequestException)
+async def upstream_failed(request, error):
+    return JSONResponse({"detail": f"Upstream service failed: {error}"}, status_code=502)
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+
+@app.get("/metrics")
+async def metrics():
+    return {
+        "rate_limits": rate_limit_metrics(),
+        "llm": llm_stats(),
+        "http": http_metrics(),
+        "avatar_providers": provider_health(),
+        "avatar_cache": avatar_cache_stats(),
+        "pdf_cache": pdf_cache_stats(),
+        "thumbnail_cache": thumbnail_cache_stats(),
+        "data_uri_cache": data_uri_stats(),
+        "photo_pool": photo_pool.stats(),
+    }
+
+
+@app.post("/personas")
+async def generate_persona(request: Request, payload: dict = Body(default={})):
+    """Generate a persona with Gemini, and its avatar when `avatar` names a provider.
+
+    {"avatar": "randomuser", "cached": true}
+        -> {"persona": {...}, "photo": base64 or null, "photo_error": str or null}
+    With cached (default) and LLM_SEED_VARIANTS set, the reply may be one of that
+    many cached variants; otherwise every call is a fresh Gemini draw.
+    """
+    provider = payload.get("avatar")
+    check_provider(provider)
+    seed = pick_seed() if payload.get("cached", True) else None
+    persona_data, avatar_job = await run_blocking(
+        request, generate_persona_with_avatar, provider,
+        service_secrets() if provider else {}, seed=seed)
+    photo = photo_error = None
+    if avatar_job is not None:
+        # The persona is still worth returning when only its avatar failed
+        try:
+            photo = await wait_for_avatar(avatar_job)
+        except (AvatarGenerationError, requests.exceptions.RequestException, HTTPException) as e:
+            photo_error = getattr(e, "detail", None) or str(e)
+    return {"persona": persona_data, "photo": encode_photo(photo), "photo_error": photo_error}
+
+
+@app.post("/personas/preview", response_class=HTMLResponse)
+async def render_preview(payload: dict = Body(...)):
+    """Standalone HTML of the card: {"persona": {...}, "photo": base64, "template": "modern"}"""
+    template, persona_data, photo = parse_render_request(payload)
+    return HTMLResponse(await run_render(preview_html, template, persona_data, photo))
+
+
+@app.post("/personas/pdf")
+async def export_pdf(payload: dict = Body(...)):
+    """PDF export, same body as /personas/preview"""
+    template, persona_data, photo = parse_render_request(payload)
+    pdf_bytes = await run_render(persona_pdf, template, persona_data, photo)
+    return Response(pdf_bytes, media_type="application/pdf",
+                    headers={"Content-Disposition": content_disposition(str(persona_data.get("name") or ""), "pdf")})
+
+
+@app.post("/personas/json")
+async def export_json(payload: dict = Body(...)):
+    """The persona normalized to the builder's JSON export shape"""
+    return normalize_persona(payload.get("persona"))
+
+
+@app.post("/avatars")
+async def fetch_avatar_image(request: Request, payload: dict = Body(...)):
+    """Avatar image for {"provider": "stability", "name", "age", "gender", "occupation"}.
+
+    Falls back along the provider chain like the builder, and waits out a loading
+    Hugging Face model up to AVATAR_JOB_DEADLINE.
+    """
+    provider = payload.get("provider", "randomuser")
+    check_provider(provider)
+    fields = normalize_persona(payload)
+    job = await run_blocking(request, start_avatar_generation, provider, fields, service_secrets())
+    photo = await wait_for_avatar(job)
+    return Response(photo, media_type=image_mime(photo))
+
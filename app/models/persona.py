@@ -0,0 +1,171 @@
+import json
+from enum import Enum
+from uuid import uuid4
+
+
+class _Option(str, Enum):
+    # Members are singletons, so every persona shares the same few option objects
+    def __str__(self):
+        return self.value
+
+    @classmethod
+    def parse(cls, value):
+        """Member for a value (case-insensitive), None when it is not an option"""
+        if isinstance(value, cls):
+            return value
+        return _OPTION_LOOKUP[cls].get(str(value).strip().lower()) if value is not None else None
+
+
+class Gender(_Option):
+    MALE = "Male"
+    FEMALE = "Female"
+    NON_BINARY = "Non-Binary"
+    OTHER = "Other"
+
+
+class Interest(_Option):
+    TECHNOLOGY = "Technology"
+    DESIGN = "Design"
+    MUSIC = "Music"
+    SPORTS = "Sports"
+    READING = "Reading"
+    TRAVEL = "Travel"
+    GAMING = "Gaming"
+    FITNESS = "Fitness"
+
+
+class Platform(_Option):
+    MOBILE = "Mobile"
+    DESKTOP = "Desktop"
+    TABLET = "Tablet"
+    SMARTWATCH = "Smartwatch"
+    VR_AR = "VR/AR"
+
+
+_OPTION_LOOKUP = {cls: {member.value.lower(): member for member in cls}
+                  for cls in (Gender, Interest, Platform)}
+
+GENDER_OPTIONS = [gender.value for gender in Gender]
+INTEREST_OPTIONS = [interest.value for interest in Interest]
+PLATFORM_OPTIONS = [platform.value for platform in Platform]
+
+TEXT_FIELDS = ("name", "occupation", "location", "goals", "frustrations",
+               "motivations", "needs", "skills", "pain_points")
+FIELDS = ("name", "age", "gender", "occupation", "location", "goals", "frustrations",
+          "motivations", "needs", "skills", "pain_points", "tech_savviness",
+          "interests", "platforms")
+
+
+def _options(cls, values):
+    if isinstance(values, str):
+        values = values.split(",")
+    parsed = (cls.parse(value) for value in values or ())
+    return tuple(dict.fromkeys(value for value in parsed if value is not None))
+
+
+def _clamped_int(value, low, high, default):
+    try:
+        return max(low, min(high, int(value)))
+    except (TypeError, ValueError):
+        return default
+
+
+class Persona:
+    """One persona: form fields, photo and a revision that changes with every edit.
+
+    Values are normalized on the way in (enums for the option fields, tuples for
+    lists, clamped numbers), so renderers and exporters can trust them.
+    """
+    __slots__ = FIELDS + ("user_photo", "uid", "revision", "library_id")
+
+    def __init__(self, **fields):
+        self.name = ""
+        self.age = 0
+        self.gender = Gender.MALE
+        self.occupation = ""
+        self.location = ""
+        self.goals = ""
+        self.frustrations = ""
+        self.motivations = ""
+        self.needs = ""
+        self.skills = ""
+        self.pain_points = ""
+        self.tech_savviness = 3
+        self.interests = ()
+        self.platforms = ()
+        self.user_photo = None
+        self.uid = uuid4().hex
+        self.revision = 0
+        # Row id in the persona library once saved, see app.services.persona_store
+        self.library_id = None
+        self.update(**fields)
+
+    @staticmethod
+    def normalize(field, value):
+        if field in TEXT_FIELDS:
+            return "" if value is None else str(value)
+        if field == "age":
+            return _clamped_int(value, 0, 100, 0)
+        if field == "tech_savviness":
+            return _clamped_int(value, 1, 5, 3)
+        if field == "gender":
+            return Gender.parse(value) or Gender.OTHER
+        if field == "interests":
+            return _options(Interest, value)
+        if field == "platforms":
+            return _options(Platform, value)
+        raise AttributeError(f"Persona has no field {field!r}")
+
+    def update(self, **fields):
+        """Set fields (and user_photo), bump the revision if anything changed"""
+        changed = False
+        for field, value in fields.items():
+            if field == "user_photo":
+                value = bytes(value) if isinstance(value, bytearray) else value
+                # Identity check, comparing photo bytes on every rerun is what we avoid
+                if value is not self.user_photo:
+                    self.user_photo = value
+                    changed = True
+                continue
+            value = self.normalize(field, value)
+            if getattr(self, field) != value:
+                setattr(self, field, value)
+                changed = True
+        if changed:
+            self.revision += 1
+        return changed
+
+    @property
+    def cache_key(self):
+        """Unique across personas and revisions, for render caches"""
+        return f"{self.uid}:{self.revision}"
+
+    def get(self, field, default=None):
+        # Lets templates and PDF backends read a Persona like the dicts they also accept
+        value = getattr(self, field, default) if field in self.__slots__ else default
+        if isinstance(value, tuple):
+            return [str(item) for item in value]
+        return str(value) if isinstance(value, _Option) else value
+
+    def missing(self, required):
+        return [field for field in required if not getattr(self, field)]
+
+    def to_dict(self, include_photo=False):
+        data = {field: self.get(field) for field in FIELDS}
+        if include_photo:
+            data["user_photo"] = self.user_photo
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{field: data[field] for field in FIELDS + ("user_photo",) if field in data})
+
+    def to_json(self, indent=None):
+        return json.dumps(self.to_dict(), indent=indent)
+
+    @classmethod
+    def from_json(cls, text):
+        return cls.from_dict(json.loads(text))
+
+    def __repr__(self):
+        return f"Persona({self.name!r}, revision={self.revision})"
@@ -0,0 +1,276 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextvars import copy_context
+
+from app.services.avatar_service import (STABILITY_SEED, STABILITY_SIZE, build_hf_prompt, build_stability_prompt,
+                                         fetch_hf_avatar, fetch_stability_avatar)
+from app.services.local_diffusion import build_local_prompt, get_local_engine
+from app.services.photo_pool import photo_pool
+from app.utils.images import normalize_image
+from app.utils.cache import BlobCache, content_digest
+from app.utils.config import get_bool_setting, get_float_setting, get_int_setting, get_setting
+
+# Order providers are tried in when the selected one fails
+FAILOVER_ORDER = ["huggingface", "stability", "randomuser"]
+
+
+class AvatarGenerationError(Exception):
+    """Every provider in the chain failed, or the selected one asked to come back later"""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__("; ".join(f"{name}: {error}" for name, error in errors)
+                         or "No avatar provider available")
+
+    @property
+    def retry_after(self):
+        # Worth another try once the soonest provider that asked us to come back is ready
+        delays = [error.retry_after for _, error in self.errors
+                  if getattr(error, "retry_after", None) is not None]
+        return min(delays) if delays else None
+
+
+class ProviderHealth:
+    """Rolling latency/failure stats used to demote slow or failing providers"""
+
+    def __init__(self, alpha=0.3):
+        self.alpha = alpha
+        self.ewma_latency = None
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_failure = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds, ok):
+        with self._lock:
+            if ok:
+                self.successes += 1
+                self.consecutive_failures = 0
+            else:
+                self.failures += 1
+                self.consecutive_failures += 1
+                self.last_failure = time.monotonic()
+            # Failures count as slow too, they cost the user the whole wait
+            if self.ewma_latency is None:
+                self.ewma_latency = seconds
+            else:
+                self.ewma_latency += self.alpha * (seconds - self.ewma_latency)
+
+    def is_degraded(self, slow_threshold, failure_threshold=3, cooldown=60.0):
+        with self._lock:
+            recently_failing = (self.consecutive_failures >= failure_threshold
+                                and time.monotonic() - self.last_failure < cooldown)
+            too_slow = self.ewma_latency is not None and self.ewma_latency > slow_threshold
+            return recently_failing or too_slow
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "successes": self.successes,
+                "failures": self.failures,
+                "consecutive_failures": self.consecutive_failures,
+                "ewma_latency_ms": 1000 * (self.ewma_latency or 0.0),
+            }
+
+
+# Generated images for deterministic providers, shared by all sessions
+avatar_cache = BlobCache(
+    "avatar",
+    max_items=get_int_setting("AVATAR_CACHE_MAX_ITEMS", 128),
+    disk_dir=get_setting("AVATAR_CACHE_DIR"),
+    max_disk_bytes=get_int_setting("AVATAR_CACHE_MAX_DISK_MB", 512) * 1024 * 1024,
+    ttl=get_int_setting("AVATAR_CACHE_TTL", 7 * 24 * 3600),
+)
+
+
+def normalize_prompt(prompt):
+    return " ".join(prompt.lower().split())
+
+
+def avatar_cache_key(provider, prompt, seed, size):
+    return content_digest(provider, normalize_prompt(prompt), seed, size)
+
+
+class AvatarProvider:
+    def __init__(self, name, required_fields, fetch, secret=None, cache_key=None):
+        self.name = name
+        self.required_fields = required_fields
+        self.secret = secret
+        self._fetch = fetch
+        # Only providers that give the same image for the same request are cached
+        self._cache_key = cache_key
+        self.health = ProviderHealth()
+
+    def available(self, secrets):
+        return self.secret is None or bool(secrets.get(self.secret))
+
+    def generate(self, fields, secrets):
+        if self._cache_key is not None:
+            key = self._cache_key(fields)
+            image = avatar_cache.get(key)
+            if image is None:
+                image = self._generate(fields, secrets)
+                if image:
+                    avatar_cache.put(key, image)
+            return image
+        return self._generate(fields, secrets)
+
+    def _generate(self, fields, secrets):
+        started = time.perf_counter()
+        try:
+            image = self._fetch(fields, secrets)
+        except Exception as e:
+            # A model still loading is not a failure, it only asks to come back later
+            if getattr(e, "retry_after", None) is None:
+                self.health.record(time.perf_counter() - started, ok=False)
+            raise
+        self.health.record(time.perf_counter() - started, ok=True)
+        return image
+
+
+def _gender(fields):
+    return fields.get("gender") or "Other"
+
+
+def _fetch_randomuser(fields, secrets):
+    return photo_pool.get(_gender(fields))
+
+
+def _fetch_stability(fields, secrets):
+    return fetch_stability_avatar(fields.get("name", ""), fields.get("occupation", ""),
+                                  _gender(fields), secrets.get("STABILITY_API_KEY"))
+
+
+def _fetch_huggingface(fields, secrets):
+    return fetch_hf_avatar(fields.get("name", ""), fields.get("age", ""), _gender(fields),
+                           fields.get("occupation", ""), secrets.get("HUGGINGFACE_TOKEN"))
+
+
+def _local_prompt(fields):
+    return build_local_prompt(fields.get("name", ""), fields.get("age", ""), _gender(fields),
+                              fields.get("occupation", ""))
+
+
+def _fetch_local(fields, secrets):
+    # Rendered at LOCAL_DIFFUSION_SIZE, stored at the same 256px as the Stability avatars
+    return normalize_image(get_local_engine().generate(_local_prompt(fields), seed=STABILITY_SEED), 256)
+
+
+def _stability_cache_key(fields):
+    prompt, negative_prompt = build_stability_prompt(
+        fields.get("name", ""), fields.get("occupation", ""), _gender(fields))
+    return avatar_cache_key("stability", prompt + "\n" + negative_prompt, STABILITY_SEED, STABILITY_SIZE)
+
+
+def _local_cache_key(fields):
+    engine = get_local_engine()
+    # Model and step count change the picture as much as the prompt does
+    return avatar_cache_key(f"local:{engine.model_id}:{engine.steps}", _local_prompt(fields),
+                            STABILITY_SEED, engine.size)
+
+
+def _huggingface_cache_key(fields):
+    # The inference API serves cached results for identical inputs, so it is deterministic too
+    prompt = build_hf_prompt(fields.get("name", ""), fields.get("age", ""), _gender(fields),
+                             fields.get("occupation", ""))
+    return avatar_cache_key("huggingface", prompt, None, None)
+
+
+PROVIDERS = {
+    # RandomUser is random by design, caching it would hand out the same face every time
+    "randomuser": AvatarProvider("randomuser", ("gender",), _fetch_randomuser),
+    "stability": AvatarProvider("stability", ("name", "occupation", "gender"), _fetch_stability,
+                                secret="STABILITY_API_KEY", cache_key=_stability_cache_key),
+    "huggingface": AvatarProvider("huggingface", ("name", "age", "gender", "occupation"), _fetch_huggingface,
+                                  cache_key=_huggingface_cache_key),
+    # Offline on our own CPU, not part of the default failover order since loading the model is heavy
+    "local": AvatarProvider("local", ("name", "age", "gender", "occupation"), _fetch_local,
+                            cache_key=_local_cache_key),
+}
+
+# Provider calls run here, separate from the callers' pools so hedging cannot deadlock them
+_provider_executor = ThreadPoolExecutor(
+    max_workers=8, thread_name_prefix="avatar-provider")
+
+
+def provider_chain(preferred, secrets):
+    """Selected provider first, then the failover order; degraded providers move to the back"""
+    names = [preferred] if preferred in PROVIDERS else []
+    if get_bool_setting("AVATAR_FAILOVER", True):
+        names += [name for name in FAILOVER_ORDER if name not in names]
+    chain = [PROVIDERS[name] for name in names if PROVIDERS[name].available(secrets)]
+
+    slow_threshold = get_float_setting("AVATAR_SLOW_THRESHOLD", 20.0)
+    # sorted() is stable, so healthy providers keep their relative order
+    return sorted(chain, key=lambda p: p.health.is_degraded(slow_threshold))
+
+
+def required_fields(preferred, secrets):
+    """Persona fields needed before the avatar chain can start"""
+    fields = []
+    for provider in provider_chain(preferred, secrets):
+        fields += [f for f in provider.required_fields if f not in fields]
+    return tuple(fields)
+
+
+def generate_avatar(fields, secrets, preferred, hedge_after=None):
+    """Return image bytes from the first provider in the chain that succeeds.
+
+    With hedge_after (seconds) set, the next provider is also started whenever the
+    ones in flight have not answered within that budget; the first good image wins.
+    Only real failures fall through: when the preferred provider asks to come back
+    later (a Hugging Face model still loading), the error carries its retry_after so
+    the avatar job re-polls it instead of handing out another provider's image.
+    """
+    if hedge_after is None:
+        hedge_after = get_float_setting("AVATAR_HEDGE_AFTER", 0.0)
+    chain = provider_chain(preferred, secrets)
+    errors = []
+    pending = {}
+    next_index = 0
+
+    def launch():
+        nonlocal next_index
+        provider = chain[next_index]
+        next_index += 1
+        # copy_context() carries the caller's rate limit session/lane into the worker
+        pending[_provider_executor.submit(copy_context().run, provider.generate, fields, secrets)] = provider
+
+    while pending or next_index < len(chain):
+        if not pending:
+            launch()
+        can_hedge = hedge_after and hedge_after > 0 and next_index < len(chain)
+        done, _ = wait(pending, timeout=hedge_after if can_hedge else None,
+                       return_when=FIRST_COMPLETED)
+        if not done:
+            launch()  # Latency budget exceeded, race the next provider
+            continue
+        for future in done:
+            provider = pending.pop(future)
+            try:
+                image = future.result()
+            except Exception as e:
+                errors.append((provider.name, e))
+                if provider.name == preferred and getattr(e, "retry_after", None) is not None:
+                    for other in pending:
+                        other.cancel()
+                    raise AvatarGenerationError(errors)
+                continue
+            if image:
+                # Losers keep running in the background, their results are dropped
+                for other in pending:
+                    other.cancel()
+                return image
+            errors.append((provider.name, "empty image"))
+
+    raise AvatarGenerationError(errors)
+
+
+def provider_health():
+    return {name: provider.health.snapshot() for name, provider in PROVIDERS.items()}
+
+
+def avatar_cache_stats():
+    return avatar_cache.stats()
@@ -1,29 +1,16 @@
-import json
-import requests
-from io import BytesIO
-from PIL import Image
-import streamlit as st
-import google.generativeai as genai
-import base64
+from app.utils.images import normalize_image
 
+HF_MODEL_PATH = "/models/stabilityai/stable-diffusion-xl-base-1.0"
 
-def generate_ai_avatar_by_HFModels():
-    try:
-        HUGGINGFACE_TOKEN = st.secrets.get("HUGGINGFACE_TOKEN")
-        # Choose your model
-        API_URL = "https://api-inference.huggingface.co/models/stabilityai/stable-diffusion-xl-base-1.0"
-
-        headers = {}
-        if HUGGINGFACE_TOKEN:
-            headers = {"Authorization": f"Bearer {HUGGINGFACE_TOKEN}"}
 
-        prompt = f"""
-        Professional LinkedIn profile photo of {st.session_state['name']}, {st.session_state['age']}-year-old {st.session_state['gender'].lower()} {st.session_state['occupation'].lower()}.
+def build_hf_prompt(name, age, gender, occupation):
+    return f"""
+        Professional LinkedIn profile photo of {name}, {age}-year-old {gender.lower()} {occupation.lower()}.
 
         **Must Include:**
         - Hyper-realistic corporate headshot
-        - {st.session_state['gender']}-appropriate business attire (e.g., {"suit and tie" if st.session_state['gender'] == "Male" else "blazer and blouse"})
-        - Clear {st.session_state['gender'].lower()} facial features
+        - {gender}-appropriate business attire (e.g., {"suit and tie" if gender == "Male" else "blazer and blouse"})
+        - Clear {gender.lower()} facial features
         - Neutral gray studio background
         - High-resolution (512x512, then downscaled to 256x256 for crispness)
 
@@ -34,54 +21,135 @@ def generate_ai_avatar_by_HFModels():
         4. Professional expression (approachable but formal)
         """
 
-        payload = {"inputs": prompt}
 
-        with st.spinner("Generating AI avatar..."):
-            response = requests.post(API_URL, headers=headers, json=payload)
-            response.raise_for_status()
+class ModelLoadingError(Exception):
+    """The inference API is still loading the model, ask again after `retry_after` seconds"""
 
-            image_bytes = response.content
-            image = Image.open(BytesIO(image_bytes))
-            buffer = BytesIO()
-            image.save(buffer, format="PNG")
-            st.session_state["user_photo"] = buffer.getvalue()
-            st.success("AI avatar generated using Hugging Face!")
+    def __init__(self, retry_after):
+        self.retry_after = retry_after
+        super().__init__(f"Model is loading, estimated {retry_after:.0f}s")
 
-    except Exception as e:
-        st.error(f"Error generating AI avatar with Stable Diffusion: {e}")
 
-
-def generate_randomuserphotoByGender(gender):
-    # Fetch random user photo
+def model_loading_time(response):
+    """Seconds until the model is ready when the inference API is still loading it, else None"""
+    if response.status_code != 503:
+        return None
     try:
-        st.info("Fetching random user photo...")
-        random_user_response = requests.get(
-            "https://randomuser.me/api/?gender="+gender)
-        # print(persona_data["gender"])
-        random_user_response.raise_for_status()
-        random_user_data = random_user_response.json()
-
-        if 'results' in random_user_data and random_user_data['results']:
-            random_user = random_user_data['results'][0]
-            if 'picture' in random_user and 'large' in random_user['picture']:
-                photo_url = random_user['picture']['large']
-                photo_response = requests.get(photo_url)
-                photo_response.raise_for_status()
-                photo_bytes = photo_response.content
-                img = Image.open(BytesIO(photo_bytes))
-                # Convert PIL Image to bytes for session state
-                buffer = BytesIO()
-                img.save(buffer, format="PNG")  # Or "JPEG"
-                st.session_state["user_photo"] = buffer.getvalue()
-              # Debug
-            else:
-                st.warning(
-                    "Random user data did not contain a large photo URL.")
-                st.session_state["user_photo"] = None
-        else:
-            st.warning("Failed to fetch random user data for photo.")
-            st.session_state["user_photo"] = None
-
-    except requests.exceptions.RequestException as e:
-        st.error(f"Error fetching random user photo: {e}")
-        st.session_state["user_photo"] = None
+        estimated_time = response.json().get("estimated_time")
+    except (ValueError, AttributeError):
+        return None
+    return float(estimated_time) if estimated_time is not None else None
+
+
+# The fetch_* functions never touch Streamlit, so they can run on worker threads.
+# They import the HTTP client (and with it requests) on first use, not at page load
+def fetch_hf_avatar(name, age, gender, occupation, token=None):
+    from app.services.http_client import RETRY_STATUSES, get_client
+
+    headers = {}
+    if token:
+        headers = {"Authorization": f"Bearer {token}"}
+
+    payload = {"inputs": build_hf_prompt(name, age, gender, occupation)}
+    # A 503 while the model loads is not retried here, the caller decides whether to wait.
+    # It is not an outage either, so it leaves the circuit breaker alone.
+    # Inference has no side effects, so a timed out call may be resent like a GET
+    response = get_client("huggingface").post(
+        HF_MODEL_PATH, headers=headers, json=payload, idempotent=True,
+        raise_for_status=False, retry_statuses=RETRY_STATUSES - {503},
+        neutral=lambda response: model_loading_time(response) is not None)
+    estimated_time = model_loading_time(response)
+    if estimated_time is not None:
+        raise ModelLoadingError(estimated_time)
+    response.raise_for_status()
+    return normalize_image(response.content)
+
+
+def fetch_randomuser_photos(gender=None, count=1):
+    """Fetch `count` random user photos with a single API call (gender None means any)"""
+    from app.services.http_client import get_client
+
+    # All round trips share one pooled keep-alive session
+    client = get_client("randomuser")
+    params = {"results": count}
+    if gender:
+        params["gender"] = gender
+    random_user_data = client.get("/api/", params=params).json()
+
+    if not random_user_data.get('results'):
+        raise ValueError("Failed to fetch random user data for photo.")
+
+    photos = []
+    for random_user in random_user_data['results']:
+        if 'picture' not in random_user or 'large' not in random_user['picture']:
+            continue
+        photo_response = client.get(random_user['picture']['large'])
+        # Already a JPEG, kept as downloaded
+        photos.append(normalize_image(photo_response.content))
+
+    if not photos:
+        raise ValueError("Random user data did not contain a large photo URL.")
+    return photos
+
+
+def fetch_randomuser_photo(gender):
+    return fetch_randomuser_photos(gender, 1)[0]
+
+
+STABILITY_SEED = 42  # For more consistent results
+STABILITY_SIZE = 512
+
+
+def build_stability_prompt(name, occupation, gender):
+    """Prompt and gender-specific negative prompt for the Stability headshot"""
+    # Enhanced prompt with strict gender control
+    prompt = f"""
+        Professional corporate headshot of {name}, {gender.lower()} {occupation.lower()}.
+        Hyper-realistic studio portrait with:
+        - Strictly {gender.lower()}-appearing subject
+        - {gender}-appropriate business attire
+        - Neutral gray background
+        - High detail (512x512 resolution)
+        - Professional hairstyle
+        - Confident expression
+        
+        Technical requirements:
+        - Photorealistic style
+        - No artistic filters
+        - No visible jewelry (unless culturally appropriate)
+        - Crisp focus on facial features
+        """
+
+    # Gender-specific negative prompts
+    negative_prompt = (
+        "woman, female, makeup, dress, earrings" if gender == "Male"
+        else "man, male, beard, mustache" if gender == "Female"
+        else "gender-stereotypical"
+    ) + ", cartoon, anime, blurry, deformed, text, watermark"
+    return prompt, negative_prompt
+
+
+def fetch_stability_avatar(name, occupation, gender, stability_key):
+    """Generate professional avatar using Stability AI with gender consistency"""
+    from app.services.http_client import get_client
+
+    prompt, negative_prompt = build_stability_prompt(name, occupation, gender)
+
+    response = get_client("stability").post(
+        "/v2beta/stable-image/generate/core",
+        headers={"Authorization": f"Bearer {stability_key}",
+                 "Accept": "image/*"},
+        files={"none": ''},
+        data={
+            "prompt": prompt,
+            "negative_prompt": negative_prompt,
+            "output_format": "png",
+            "width": str(STABILITY_SIZE),
+            "height": str(STABILITY_SIZE),
+            "seed": STABILITY_SEED,
+        },
+    )
+
+    # Standardize to a 256px square in a single decode/encode
+    return normalize_image(response.content, 256)
+
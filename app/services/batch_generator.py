@@ -0,0 +1,211 @@
+import io
+import json
+import random
+import threading
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextvars import copy_context
+from itertools import islice
+
+from app.services.llm_client import get_model
+from app.services.persona_generator import fetch_avatar, generate_persona_array, generate_persona_data
+from app.services.rate_limiter import is_rate_limited, rate_limit_context
+from app.utils.dedup import LSHIndex, persona_signature
+from app.utils.images import image_extension
+
+
+class BatchScheduler:
+    """Spaces request starts to a requests-per-minute budget and backs off everyone on 429s"""
+
+    def __init__(self, requests_per_minute=30, max_backoff=60):
+        self.min_interval = 60.0 / max(1, requests_per_minute)
+        self.max_backoff = max_backoff
+        self._next_slot = time.monotonic()
+        self._backoff = 0.0
+        self._lock = threading.Lock()
+
+    def wait_turn(self, cancel_event=None):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.min_interval
+        delay = slot - time.monotonic()
+        if delay > 0:
+            if cancel_event is not None:
+                return not cancel_event.wait(delay)
+            time.sleep(delay)
+        return True
+
+    def report_rate_limited(self):
+        with self._lock:
+            self._backoff = min(self.max_backoff, max(2.0, self._backoff * 2))
+            # Jitter so the workers do not all come back at the same instant
+            pause = self._backoff * random.uniform(0.8, 1.2)
+            self._next_slot = max(self._next_slot, time.monotonic() + pause)
+
+    def report_success(self):
+        with self._lock:
+            self._backoff = 0.0
+
+
+class BatchResult:
+    def __init__(self, requested):
+        self.requested = requested
+        self.personas = []
+        self.errors = []
+        self.failed = 0
+        # Near-duplicates dropped (and re-requested) in distinct mode
+        self.duplicates = 0
+        self.cancelled = False
+
+    @property
+    def completed(self):
+        return len(self.personas) + self.failed
+
+
+def _generate_group(size, model, scheduler, photo_provider, secrets, max_retries, cancel_event):
+    personas = []
+    last_error = None
+    attempt = 0
+    # A short array reply counts as an attempt, the next request asks for the rest
+    while len(personas) < size and attempt <= max_retries:
+        if not scheduler.wait_turn(cancel_event):
+            break
+        try:
+            if size == 1:
+                personas.append(generate_persona_data(model))
+            else:
+                missing = size - len(personas)
+                personas.extend(islice(generate_persona_array(missing, model), missing))
+            scheduler.report_success()
+        except Exception as e:
+            if is_rate_limited(e):
+                scheduler.report_rate_limited()
+            last_error = e
+        attempt += 1
+
+    if not personas and last_error is not None:
+        raise last_error
+
+    if photo_provider:
+        for persona in personas:
+            try:
+                persona["user_photo"] = fetch_avatar(
+                    photo_provider, persona, secrets)
+            except Exception:
+                # A missing photo should not cost us the persona itself
+                persona["user_photo"] = None
+    return personas
+
+
+def _split(count, group_size):
+    return [min(group_size, count - start) for start in range(0, count, group_size)]
+
+
+def generate_persona_batch(count, concurrency=4, requests_per_minute=30, max_retries=3,
+                           personas_per_request=1, photo_provider=None, secrets=None,
+                           model=None, on_progress=None, cancel_event=None,
+                           distinct=False, library=None, max_duplicates=None):
+    """Generate `count` validated personas with bounded concurrency.
+
+    With personas_per_request > 1 each Gemini call returns an array of personas, which
+    amortizes the prompt over several results. on_progress(result, new_personas, error)
+    runs on the calling thread after each request, so it may update Streamlit widgets.
+    Setting cancel_event stops the batch early; whatever finished so far is returned.
+
+    With distinct=True near-duplicates of personas already in the batch (or in the
+    `library` PersonaStore, when given) are dropped and requested again, until
+    `count` distinct personas are in or max_duplicates (default: count) were dropped.
+    Each check is an LSH lookup, not a comparison with every persona so far.
+    """
+    if model is None:
+        model = get_model()
+    scheduler = BatchScheduler(requests_per_minute)
+    cancel_event = cancel_event or threading.Event()
+    result = BatchResult(count)
+    seen = LSHIndex() if distinct else None
+    max_duplicates = count if max_duplicates is None else max_duplicates
+
+    group_size = max(1, personas_per_request)
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="persona-batch") as executor:
+        def submit(size):
+            # Batch requests queue behind interactive ones in the shared rate limiters
+            with rate_limit_context(lane="batch"):
+                return executor.submit(copy_context().run, _generate_group, size, model, scheduler,
+                                       photo_provider, secrets or {}, max_retries, cancel_event)
+
+        futures = {submit(size): size for size in _split(count, group_size)}
+        try:
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    size = futures.pop(future)
+                    personas, error = [], None
+                    try:
+                        personas = future.result()
+                    except Exception as e:
+                        error = e
+                        result.errors.append(str(e))
+                    if not cancel_event.is_set():
+                        result.failed += max(0, size - len(personas))
+
+                    if seen is not None:
+                        personas, dropped = _drop_duplicates(personas, seen, library)
+                        result.duplicates += dropped
+                        if dropped and not cancel_event.is_set():
+                            if result.duplicates <= max_duplicates:
+                                # Ask again for as many as were dropped
+                                futures.update((submit(group), group) for group in _split(dropped, group_size))
+                            else:
+                                result.failed += dropped
+                    result.personas.extend(personas)
+                    if on_progress is not None:
+                        on_progress(result, personas, error)
+        finally:
+            # Also covers the caller bailing out (e.g. Streamlit stopping the script)
+            cancel_event.set()
+            for future in futures:
+                future.cancel()
+
+    result.cancelled = result.completed < count
+    return result
+
+
+def _drop_duplicates(personas, seen, library):
+    """(distinct personas, number dropped). Kept ones are added to `seen`"""
+    kept = []
+    for persona in personas:
+        signature = persona_signature(persona)
+        duplicate = seen.find_duplicate(signature)
+        if duplicate is None and library is not None and signature is not None:
+            duplicate = library.find_duplicate(persona, signature=signature)
+        if duplicate is None:
+            seen.add(len(seen), signature)
+            kept.append(persona)
+    return kept, len(personas) - len(kept)
+
+
+def persona_export_dict(persona):
+    """The JSON shape used for exports (photo bytes are not JSON serializable)"""
+    return {k: v for k, v in persona.items() if k != "user_photo"}
+
+
+def personas_to_jsonl(personas):
+    return "".join(json.dumps(persona_export_dict(p)) + "\n" for p in personas).encode("utf-8")
+
+
+def personas_to_zip(personas):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for index, persona in enumerate(personas, start=1):
+            archive.writestr(f"persona_{index:04d}.json",
+                             json.dumps(persona_export_dict(persona), indent=2))
+            photo = persona.get("user_photo")
+            if photo:
+                # Images are already compressed, deflating them only burns CPU. RandomUser
+                # photos are kept as the JPEGs they arrive as, so name them by what they are
+                archive.writestr(f"persona_{index:04d}{image_extension(photo)}", photo,
+                                 compress_type=zipfile.ZIP_STORED)
+    return buffer.getvalue()
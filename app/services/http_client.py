@@ -0,0 +1,280 @@
+import logging
+import random
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.services.rate_limiter import get_limiter
+from app.utils.config import get_setting, get_float_setting, get_int_setting
+
+logger = logging.getLogger(__name__)
+
+# Per-service defaults, each can be overridden with <SERVICE>_BASE_URL,
+# <SERVICE>_CONNECT_TIMEOUT, <SERVICE>_READ_TIMEOUT and <SERVICE>_RETRIES
+SERVICE_DEFAULTS = {
+    "randomuser": {"base_url": "https://randomuser.me", "connect_timeout": 3.05, "read_timeout": 10, "retries": 2},
+    "huggingface": {"base_url": "https://api-inference.huggingface.co", "connect_timeout": 3.05, "read_timeout": 60, "retries": 2},
+    "stability": {"base_url": "https://api.stability.ai", "connect_timeout": 3.05, "read_timeout": 10, "retries": 1},
+}
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Safe to resend after the request may already have reached the server
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+# The service (or the path to it) failed, as opposed to a bad URL or redirect loop
+TRANSPORT_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                    requests.exceptions.ChunkedEncodingError, requests.exceptions.ContentDecodingError)
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised without touching the network while a service's circuit is open"""
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures, lets one probe through after `reset_timeout`"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._probe_thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout or self._probing:
+                return False
+            self._probing = True  # Half-open: exactly one trial request
+            self._probe_thread = threading.get_ident()
+            return True
+
+    def release_probe(self):
+        """End this thread's half-open probe when it produced no verdict (client-side
+        error, interrupt), so the next caller may probe instead of the circuit staying open"""
+        with self._lock:
+            if self._probing and self._probe_thread == threading.get_ident():
+                self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+def is_connect_error(error):
+    """The request never reached the server, so even a POST can be sent again"""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(error, requests.exceptions.ConnectionError):
+        from urllib3.exceptions import NewConnectionError
+        reason = getattr(error.args[0], "reason", None) if error.args else None
+        return isinstance(reason, NewConnectionError)
+    return False
+
+
+class ServiceMetrics:
+    def __init__(self, window=256):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.total_seconds = 0.0
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds, ok):
+        with self._lock:
+            self.requests += 1
+            self.total_seconds += seconds
+            self._latencies.append(seconds)
+            if not ok:
+                self.errors += 1
+
+    def record_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def snapshot(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+
+            def percentile(p):
+                return latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else 0.0
+
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "retries": self.retries,
+                "avg_ms": 1000 * self.total_seconds / self.requests if self.requests else 0.0,
+                "p50_ms": 1000 * percentile(0.50),
+                "p95_ms": 1000 * percentile(0.95),
+            }
+
+
+class ServiceClient:
+    """Pooled keep-alive session for one external service with timeouts, retries and a circuit breaker"""
+
+    def __init__(self, name, base_url, connect_timeout=3.05, read_timeout=30, retries=2,
+                 backoff=0.5, max_backoff=8.0, pool_size=10, failure_threshold=5, reset_timeout=30.0,
+                 limiter=None):
+        self.name = name
+        # Shared quota across sessions, None means no client-side rate limit
+        self.limiter = limiter
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.metrics = ServiceMetrics()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def url(self, path):
+        # Absolute URLs (e.g. randomuser picture links) reuse the same pooled session
+        if path.startswith(("http://", "https://")):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def _sleep_before_retry(self, attempt, response=None):
+        delay = None
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                delay = float(retry_after)
+        if delay is None:
+            # Full jitter exponential backoff
+            delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        time.sleep(min(delay, self.max_backoff))
+
+    def request(self, method, path, raise_for_status=True, retry_statuses=RETRY_STATUSES,
+                idempotent=None, neutral=None, **kwargs):
+        """`neutral(response)` marks replies that say nothing about the service's health
+        (e.g. a model still loading): they neither trip nor close the circuit"""
+        kwargs.setdefault("timeout", self.timeout)
+        url = self.url(path)
+        if idempotent is None:
+            idempotent = method.upper() in IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            # Token first: a RateLimitTimeout must not strand the breaker's half-open probe
+            if self.limiter is not None:
+                self.limiter.acquire()
+            if not self.breaker.allow():
+                raise CircuitOpenError(f"{self.name} is unavailable (circuit open), try again shortly")
+
+            started = time.perf_counter()
+            response, error = None, None
+            try:
+                try:
+                    response = self.session.request(method, url, **kwargs)
+                except requests.exceptions.RequestException as e:
+                    error = e
+                elapsed = time.perf_counter() - started
+
+                is_neutral = response is not None and neutral is not None and neutral(response)
+                server_failure = (isinstance(error, TRANSPORT_ERRORS)
+                                  or (response is not None and response.status_code >= 500 and not is_neutral))
+                ok = error is None and (response.status_code < 400 or is_neutral)
+                self.metrics.record(elapsed, ok)
+                logger.debug("%s %s %s -> %s in %.0f ms", self.name, method, url,
+                             error or response.status_code, elapsed * 1000)
+
+                if server_failure:
+                    self.breaker.record_failure()
+                elif error is None and not is_neutral:
+                    self.breaker.record_success()
+            finally:
+                # A probe ending in anything else (InvalidURL, TooManyRedirects, an
+                # interrupt) must not leave the circuit stuck open
+                self.breaker.release_probe()
+
+            rate_limited = response is not None and response.status_code == 429
+            if rate_limited and self.limiter is not None:
+                retry_after = response.headers.get("Retry-After")
+                self.limiter.report_rate_limited(
+                    float(retry_after) if retry_after and retry_after.isdigit() else None)
+
+            if error is not None:
+                # A read timeout may mean the server already did (and billed) the work
+                retryable = (isinstance(error, TRANSPORT_ERRORS) if idempotent
+                             else is_connect_error(error))
+            else:
+                retryable = response.status_code in retry_statuses
+            if retryable and attempt < self.retries:
+                self.metrics.record_retry()
+                # After a 429 the limiter holds every caller back, no need to sleep here as well
+                if not (rate_limited and self.limiter is not None):
+                    self._sleep_before_retry(attempt, response)
+                attempt += 1
+                continue
+
+            if error is not None:
+                raise error
+            if raise_for_status:
+                response.raise_for_status()
+            return response
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(service):
+    """Process-wide client for an external service, configured from settings on first use"""
+    with _clients_lock:
+        client = _clients.get(service)
+        if client is None:
+            defaults = SERVICE_DEFAULTS[service]
+            prefix = service.upper()
+            client = ServiceClient(
+                service,
+                base_url=get_setting(f"{prefix}_BASE_URL", defaults["base_url"]),
+                connect_timeout=get_float_setting(f"{prefix}_CONNECT_TIMEOUT", defaults["connect_timeout"]),
+                read_timeout=get_float_setting(f"{prefix}_READ_TIMEOUT", defaults["read_timeout"]),
+                retries=get_int_setting(f"{prefix}_RETRIES", defaults["retries"]),
+                pool_size=get_int_setting("HTTP_POOL_SIZE", 10),
+                failure_threshold=get_int_setting("HTTP_BREAKER_THRESHOLD", 5),
+                reset_timeout=get_float_setting("HTTP_BREAKER_RESET", 30.0),
+                limiter=get_limiter(service),
+            )
+            _clients[service] = client
+        return client
+
+
+def http_metrics():
+    with _clients_lock:
+        clients = dict(_clients)
+    return {name: dict(client.metrics.snapshot(), circuit=client.breaker.state)
+            for name, client in clients.items()}
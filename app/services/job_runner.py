@@ -0,0 +1,166 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from uuid import uuid4
+
+from app.utils.config import get_float_setting, get_int_setting
+
+logger = logging.getLogger(__name__)
+
+
+class Job:
+    """Handle for one background job. Keep job.id in session state, not the object"""
+
+    def __init__(self, fn, args, kwargs, deadline):
+        self.id = uuid4().hex
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.deadline = deadline
+        self.context = copy_context()
+        self.status = "queued"  # queued, running, waiting, done, failed
+        self.attempts = 0
+        self.next_attempt_at = None
+        self.message = ""
+        self.result = None
+        self.error = None
+        self.finished_at = None
+        self._finished = threading.Event()
+        self._callbacks = []
+        self._callbacks_lock = threading.Lock()
+
+    def done(self):
+        return self._finished.is_set()
+
+    def wait(self, timeout=None):
+        """Block up to `timeout` seconds, True once the job has finished"""
+        return self._finished.wait(timeout)
+
+    def add_done_callback(self, fn):
+        """Call fn(job) once the job has finished (right away if it already has), on the
+        thread that finishes it, so waiters need not block a thread on wait()"""
+        with self._callbacks_lock:
+            if self._callbacks is not None:
+                self._callbacks.append(fn)
+                return
+        fn(self)
+
+    def _finish(self, status, result=None, error=None):
+        self.status = status
+        self.result = result
+        self.error = error
+        self.finished_at = time.monotonic()
+        self._finished.set()
+        with self._callbacks_lock:
+            callbacks, self._callbacks = self._callbacks, None
+        for fn in callbacks:
+            try:
+                fn(self)
+            except Exception:
+                logger.exception("Done callback of job %s failed", self.id)
+
+    def snapshot(self):
+        retry_in = None
+        if self.status == "waiting" and self.next_attempt_at is not None:
+            retry_in = max(0.0, self.next_attempt_at - time.monotonic())
+        return {"id": self.id, "status": self.status, "attempts": self.attempts,
+                "message": self.message, "retry_in": retry_in}
+
+
+class JobRunner:
+    """Worker pool for slow jobs (avatars) that must not hold Streamlit script threads.
+
+    A job that raises an exception with a `retry_after` attribute (e.g. a model that
+    is still loading) is not failed: it is re-polled after that many seconds, from a
+    timer heap, as long as it stays within its deadline. Nothing sleeps on a worker.
+    """
+
+    def __init__(self, max_workers=4, max_retry_delay=30.0, result_ttl=600.0):
+        self.max_retry_delay = max_retry_delay
+        self.result_ttl = result_ttl
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._timers = []
+        self._sequence = itertools.count()
+        self._timer_condition = threading.Condition()
+        self._timer_thread = threading.Thread(
+            target=self._run_timers, name="job-timers", daemon=True)
+        self._timer_thread.start()
+
+    def submit(self, fn, *args, deadline=300.0, **kwargs):
+        """Run fn(*args, **kwargs) in the background, return the Job handle"""
+        job = Job(fn, args, kwargs, time.monotonic() + deadline)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _prune(self):
+        # Caller holds the lock. Results nobody collected are dropped after result_ttl
+        now = time.monotonic()
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at is not None and now - job.finished_at > self.result_ttl]:
+            del self._jobs[job_id]
+
+    def _run(self, job):
+        job.status = "running"
+        job.attempts += 1
+        try:
+            # The submitter's context carries its rate limit session and lane
+            result = job.context.copy().run(job.fn, *job.args, **job.kwargs)
+        except Exception as e:
+            retry_after = getattr(e, "retry_after", None)
+            if retry_after is not None and time.monotonic() + retry_after < job.deadline:
+                delay = min(max(1.0, retry_after), self.max_retry_delay)
+                job.status = "waiting"
+                job.message = str(e)
+                job.next_attempt_at = time.monotonic() + delay
+                self._schedule(job, delay)
+                return
+            logger.warning("Job %s failed after %d attempt(s): %s", job.id, job.attempts, e)
+            job._finish("failed", error=e)
+            return
+        job._finish("done", result=result)
+
+    def _schedule(self, job, delay):
+        with self._timer_condition:
+            heapq.heappush(self._timers, (time.monotonic() + delay, next(self._sequence), job))
+            self._timer_condition.notify()
+
+    def _run_timers(self):
+        while True:
+            with self._timer_condition:
+                while not self._timers or self._timers[0][0] > time.monotonic():
+                    timeout = self._timers[0][0] - time.monotonic() if self._timers else None
+                    self._timer_condition.wait(timeout)
+                _, _, job = heapq.heappop(self._timers)
+            job.status = "queued"
+            self._executor.submit(self._run, job)
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_job_runner():
+    """Process-wide job runner configured by the JOB_* settings"""
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = JobRunner(
+                max_workers=get_int_setting("JOB_WORKERS", 4),
+                max_retry_delay=get_float_setting("JOB_MAX_RETRY_DELAY", 30.0),
+                result_ttl=get_float_setting("JOB_RESULT_TTL", 600.0),
+            )
+        return _runner
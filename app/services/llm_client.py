@@ -0,0 +1,225 @@
+import json
+import random
+import threading
+
+from app.services.rate_limiter import get_limiter, is_rate_limited
+from app.utils.cache import BlobCache, content_digest
+from app.utils.config import get_int_setting, get_setting
+
+DEFAULT_MODEL = "gemini-2.0-flash"
+
+# Finished replies keyed by (model, prompt, generation config), shared by all sessions
+llm_cache = BlobCache(
+    "llm",
+    max_items=get_int_setting("LLM_CACHE_MAX_ITEMS", 256),
+    max_memory_bytes=16 * 1024 * 1024,
+    disk_dir=get_setting("LLM_CACHE_DIR"),
+    ttl=get_int_setting("LLM_CACHE_TTL", 3600),
+)
+
+_models = {}
+_models_lock = threading.Lock()
+_configured = False
+
+
+def get_model(name=None):
+    """One GenerativeModel per model name for the whole process.
+
+    The SDK is imported and configured with GEMINI_API_KEY here, on the first
+    generation, so page loads that never call Gemini don't pay for it.
+    """
+    global _configured
+    name = name or get_setting("GEMINI_MODEL", DEFAULT_MODEL)
+    with _models_lock:
+        model = _models.get(name)
+        if model is None:
+            import google.generativeai as genai
+
+            if not _configured:
+                options = {}
+                base_url = get_setting("GEMINI_BASE_URL")
+                if base_url:
+                    # e.g. tools/stub_server.py, only the REST transport talks plain HTTP
+                    options = {"transport": "rest", "client_options": {"api_endpoint": base_url}}
+                genai.configure(api_key=get_setting("GEMINI_API_KEY"), **options)
+                _configured = True
+            model = genai.GenerativeModel(name)
+            _models[name] = model
+        return model
+
+
+def pick_seed():
+    """Random variant seed for a cacheable request, None (a fresh, uncached call) by default.
+
+    With LLM_SEED_VARIANTS=N identical prompts spread over N cached replies shared by
+    every user of the process: repeat clicks stay cheap, but at most N distinct
+    personas come back per prompt until the cache expires.
+    """
+    variants = get_int_setting("LLM_SEED_VARIANTS", 0)
+    return random.randrange(variants) if variants > 0 else None
+
+
+def seeded_prompt(prompt, seed):
+    return f"""{prompt}
+        - Variation seed: {seed} (different seeds must give clearly different results)"""
+
+
+class _Flight:
+    """One in-flight model call whose chunks are replayed to every waiting caller"""
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.followers = 0  # Guarded by _flights_lock
+        self.condition = threading.Condition()
+
+    def publish(self, chunk=None, done=False, error=None):
+        with self.condition:
+            if chunk is not None:
+                self.chunks.append(chunk)
+            self.done = self.done or done
+            self.error = error or self.error
+            self.condition.notify_all()
+
+    def replay(self):
+        index = 0
+        while True:
+            with self.condition:
+                while index >= len(self.chunks) and not self.done:
+                    self.condition.wait()
+                pending = self.chunks[index:]
+                finished, error = self.done, self.error
+            index += len(pending)
+            yield from pending
+            if finished and index >= len(self.chunks):
+                if error is not None:
+                    raise error
+                return
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+_stats = {"calls": 0, "cache_hits": 0, "coalesced": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(stat):
+    with _stats_lock:
+        _stats[stat] += 1
+
+
+def _model_stream(model, prompt, generation_config):
+    limiter = get_limiter("gemini")
+    limiter.acquire()
+    _count("calls")
+    kwargs = {"stream": True}
+    if generation_config is not None:
+        kwargs["generation_config"] = generation_config
+    try:
+        for chunk in model.generate_content(prompt, **kwargs):
+            try:
+                yield chunk.text
+            except ValueError:  # Chunk without text parts (e.g. finish metadata)
+                continue
+    except Exception as e:
+        if is_rate_limited(e):
+            limiter.report_rate_limited()
+        raise
+
+
+def _cache_key(model, prompt, generation_config):
+    return content_digest(getattr(model, "model_name", str(model)), prompt,
+                          json.dumps(generation_config, sort_keys=True, default=str))
+
+
+def _land(key, flight, error=None):
+    """Finish a flight: cache the reply when it is complete, then wake the followers"""
+    if error is None:
+        # Cached before the flight is dropped, so a new caller finds one or the other
+        llm_cache.put(key, "".join(flight.chunks).encode("utf-8"))
+    with _flights_lock:
+        _flights.pop(key, None)
+    flight.publish(done=True, error=error)
+
+
+def _drain(key, flight, stream):
+    """Read the rest of a stream its leader abandoned, for the followers still waiting"""
+    try:
+        for chunk in stream:
+            flight.publish(chunk)
+    except Exception as e:
+        _land(key, flight, error=e)
+        return
+    _land(key, flight)
+
+
+def stream_generate(prompt, model=None, generation_config=None, seed=None):
+    """Yield the model's reply to `prompt` chunk by chunk.
+
+    Without a seed every call is a fresh draw straight from the model. With a seed
+    the reply is cached by (model, seeded prompt, generation config), and callers
+    asking for the same key while it is being generated share that single call.
+    """
+    model = model or get_model()
+    if seed is None:
+        yield from _model_stream(model, prompt, generation_config)
+        return
+
+    prompt = seeded_prompt(prompt, seed)
+    key = _cache_key(model, prompt, generation_config)
+    cached = llm_cache.get(key)
+    if cached is not None:
+        _count("cache_hits")
+        yield cached.decode("utf-8")
+        return
+
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+        else:
+            flight.followers += 1
+    if not leader:
+        _count("coalesced")
+        yield from flight.replay()
+        return
+
+    stream = _model_stream(model, prompt, generation_config)
+    try:
+        for chunk in stream:
+            flight.publish(chunk)
+            yield chunk
+    except GeneratorExit:
+        # Our caller stopped reading early (e.g. a Streamlit rerun). A partial reply
+        # is never cached nor passed off as complete: followers get the rest from a
+        # background reader, without followers the call is dropped
+        with _flights_lock:
+            hand_off = flight.followers > 0
+            if not hand_off:
+                _flights.pop(key, None)
+        if hand_off:
+            threading.Thread(target=_drain, args=(key, flight, stream),
+                             name="llm-drain", daemon=True).start()
+        else:
+            stream.close()
+            flight.publish(done=True, error=RuntimeError("The model call was abandoned"))
+        raise
+    except BaseException as e:
+        _land(key, flight, error=e)
+        raise
+    _land(key, flight)
+
+
+def forget_reply(prompt, model=None, generation_config=None, seed=None):
+    """Drop a cached reply the caller could not use, so the next request regenerates it"""
+    if seed is not None:
+        llm_cache.delete(_cache_key(model or get_model(), seeded_prompt(prompt, seed), generation_config))
+
+
+def llm_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["cache"] = llm_cache.stats()
+    return stats
@@ -0,0 +1,147 @@
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+from io import BytesIO
+
+from app.utils.config import get_float_setting, get_int_setting, get_setting
+
+logger = logging.getLogger(__name__)
+
+# sd-turbo gives usable portraits in 1-4 steps without classifier-free guidance,
+# which keeps CPU inference in the seconds range
+DEFAULT_MODEL = "stabilityai/sd-turbo"
+
+
+def build_local_prompt(name, age, gender, occupation):
+    # CLIP only reads the first 77 tokens, so keep it short and front-load the subject
+    return (f"professional corporate headshot photo of a {age}-year-old {gender.lower()} "
+            f"{occupation.lower()}, neutral gray studio background, business attire, "
+            f"photorealistic, sharp focus, soft lighting")
+
+
+class LocalDiffusionEngine:
+    """Text-to-image pipeline loaded once per process and run on the CPU.
+
+    Concurrent requests are queued and coalesced into batches of up to
+    `max_batch` prompts, one pipeline call at a time, so several sessions
+    asking at once share a single forward pass.
+    """
+
+    def __init__(self, model_id=DEFAULT_MODEL, steps=2, size=512, threads=4,
+                 guidance_scale=0.0, max_batch=4, batch_window=0.05):
+        self.model_id = model_id
+        self.steps = steps
+        self.size = size
+        self.threads = threads
+        self.guidance_scale = guidance_scale
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+
+        self._pipeline = None
+        self._load_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+    def _load(self):
+        with self._load_lock:
+            if self._pipeline is None:
+                import torch
+                from diffusers import AutoPipelineForText2Image
+
+                # Cap intra-op threads so inference does not starve the Streamlit server
+                torch.set_num_threads(self.threads)
+                logger.info("Loading %s for local avatar generation", self.model_id)
+                pipeline = AutoPipelineForText2Image.from_pretrained(
+                    self.model_id, torch_dtype=torch.float32)
+                pipeline.to("cpu")
+                pipeline.set_progress_bar_config(disable=True)
+                self._pipeline = pipeline
+        return self._pipeline
+
+    def _run(self, prompts, seeds):
+        import torch
+
+        pipeline = self._load()
+        generators = [torch.Generator("cpu").manual_seed(seed) for seed in seeds]
+        with torch.inference_mode():
+            images = pipeline(
+                prompt=prompts,
+                num_inference_steps=self.steps,
+                guidance_scale=self.guidance_scale,
+                width=self.size,
+                height=self.size,
+                generator=generators,
+            ).images
+
+        results = []
+        for image in images:
+            buffer = BytesIO()
+            image.save(buffer, format="PNG")
+            results.append(buffer.getvalue())
+        return results
+
+    def _ensure_worker(self):
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._serve, name="local-diffusion", daemon=True)
+                self._worker.start()
+
+    def _serve(self):
+        while True:
+            batch = [self._queue.get()]
+            # Give concurrent callers a moment to join the same forward pass
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get(timeout=self.batch_window))
+                except queue.Empty:
+                    break
+
+            futures = [future for _, _, future in batch]
+            try:
+                images = self._run([prompt for prompt, _, _ in batch],
+                                   [seed for _, seed, _ in batch])
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            for future, image in zip(futures, images):
+                future.set_result(image)
+
+    def submit(self, prompt, seed=0):
+        """Future resolving to PNG bytes for one prompt"""
+        future = Future()
+        self._queue.put((prompt, seed, future))
+        self._ensure_worker()
+        return future
+
+    def generate(self, prompt, seed=0, timeout=None):
+        return self.submit(prompt, seed).result(timeout=timeout)
+
+    def generate_batch(self, prompts, seeds=None):
+        """PNG bytes for each prompt, run as one or more batched pipeline calls"""
+        seeds = seeds or [0] * len(prompts)
+        futures = [self.submit(prompt, seed) for prompt, seed in zip(prompts, seeds)]
+        return [future.result() for future in futures]
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_local_engine():
+    """Process-wide engine configured by the LOCAL_DIFFUSION_* settings, the model loads on first use"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = LocalDiffusionEngine(
+                model_id=get_setting("LOCAL_DIFFUSION_MODEL", DEFAULT_MODEL),
+                steps=get_int_setting("LOCAL_DIFFUSION_STEPS", 2),
+                size=get_int_setting("LOCAL_DIFFUSION_SIZE", 512),
+                threads=get_int_setting("LOCAL_DIFFUSION_THREADS", 4),
+                guidance_scale=get_float_setting("LOCAL_DIFFUSION_GUIDANCE", 0.0),
+                max_batch=get_int_setting("LOCAL_DIFFUSION_BATCH", 4),
+            )
+        return _engine
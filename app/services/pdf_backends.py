@@ -0,0 +1,213 @@
+import atexit
+import logging
+import queue
+import subprocess
+import threading
+from io import BytesIO
+
+from app.utils.config import get_setting, get_int_setting
+from app.utils.images import thumbnail
+
+logger = logging.getLogger(__name__)
+
+
+class PdfkitBackend:
+    """Spawns a fresh wkhtmltopdf process per render (the original behaviour)"""
+    name = "pdfkit"
+
+    def render(self, html_content, persona_data=None):
+        import pdfkit
+        return pdfkit.from_string(html_content, output_path=False)
+
+
+class PooledWkhtmltopdfBackend:
+    """Keeps warm wkhtmltopdf processes waiting on stdin and feeds them HTML over pipes"""
+    name = "pool"
+
+    def __init__(self, size=2, binary="wkhtmltopdf", timeout=60):
+        self.size = max(1, size)
+        self.binary = binary
+        self.timeout = timeout
+        # At most `size` processes exist at any time: idle ones sit in the queue,
+        # a busy one is only replaced once it has finished
+        self._idle = queue.Queue()
+        self._closed = False
+        for _ in range(self.size):
+            self._idle.put(self._spawn())
+        atexit.register(self.close)
+
+    def _spawn(self):
+        # Each process pays its Qt/WebKit startup while it sits idle
+        return subprocess.Popen(
+            [self.binary, "--quiet", "--encoding", "utf-8", "-", "-"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def _replenish(self):
+        """Replace a used process in the background, the caller does not wait for its startup"""
+        def spawn():
+            try:
+                process = self._spawn()
+            except OSError:
+                logger.exception("Could not start a replacement wkhtmltopdf process")
+                return
+            if self._closed:
+                process.kill()
+                process.wait()
+            else:
+                self._idle.put(process)
+
+        threading.Thread(target=spawn, name="wkhtmltopdf-spawn", daemon=True).start()
+
+    def render(self, html_content, persona_data=None):
+        try:
+            process = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise RuntimeError(f"No PDF renderer became free within {self.timeout}s, "
+                               f"all {self.size} wkhtmltopdf processes are busy (PDF_POOL_SIZE)") from None
+        try:
+            if process.poll() is not None:  # Died while idle
+                process = self._spawn()
+            try:
+                pdf_bytes, stderr = process.communicate(
+                    html_content.encode("utf-8"), timeout=self.timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.communicate()
+                raise RuntimeError("wkhtmltopdf timed out")
+            if not pdf_bytes:
+                raise RuntimeError(
+                    f"wkhtmltopdf failed ({process.returncode}): {stderr.decode('utf-8', 'replace').strip()}")
+            return pdf_bytes
+        finally:
+            if not self._closed:
+                self._replenish()
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                process = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            process.kill()
+            process.wait()
+
+
+# Accent colours per template for the fpdf backend
+FPDF_TEMPLATE_STYLES = {
+    "basic": {"accent": (51, 51, 51), "background": (249, 249, 249)},
+    "modern": {"accent": (44, 62, 80), "background": (255, 255, 255)},
+    "professional": {"accent": (34, 34, 34), "background": (240, 240, 240)},
+    "creative": {"accent": (0, 131, 143), "background": (224, 247, 250)},
+}
+
+
+def _latin1(value):
+    # The built-in PDF fonts are latin-1 only, so emojis and the like are dropped
+    return str(value if value is not None else "").encode("latin-1", "ignore").decode("latin-1").strip()
+
+
+class FpdfBackend:
+    """Builds the persona card directly with fpdf2, no HTML engine or subprocess involved"""
+    name = "fpdf"
+
+    def render(self, html_content, persona_data=None):
+        from fpdf import FPDF
+
+        persona_data = persona_data or {}
+        style = FPDF_TEMPLATE_STYLES.get(
+            persona_data.get("selected_template", "basic"), FPDF_TEMPLATE_STYLES["basic"])
+
+        pdf = FPDF(format="A4")
+        pdf.set_auto_page_break(auto=True, margin=15)
+        pdf.add_page()
+        pdf.set_fill_color(*style["background"])
+        pdf.rect(10, 10, pdf.w - 20, pdf.h - 20, style="F")
+
+        photo = persona_data.get("user_photo")
+        if isinstance(photo, (bytes, bytearray)) and photo:
+            try:
+                # 240px covers the 30mm photo at ~200 dpi
+                pdf.image(BytesIO(thumbnail(photo, 240)), x=(pdf.w - 30) / 2, y=18, w=30, h=30)
+                pdf.set_y(52)
+            except Exception:
+                pdf.set_y(20)
+        else:
+            pdf.set_y(20)
+
+        pdf.set_text_color(*style["accent"])
+        pdf.set_font("Helvetica", "B", 20)
+        pdf.cell(0, 10, _latin1(persona_data.get("name", "User Persona")),
+                 align="C", new_x="LMARGIN", new_y="NEXT")
+
+        pdf.set_text_color(119, 119, 119)
+        pdf.set_font("Helvetica", "", 11)
+        subtitle = " | ".join(part for part in (
+            _latin1(persona_data.get("occupation")),
+            _latin1(persona_data.get("location")),
+            f"{persona_data.get('age', '')} years" if persona_data.get("age") else "",
+        ) if part)
+        pdf.cell(0, 7, subtitle, align="C", new_x="LMARGIN", new_y="NEXT")
+        pdf.ln(4)
+
+        sections = [
+            ("Basic Information", [
+                ("Gender", persona_data.get("gender")),
+                ("Tech Savviness", f"{persona_data.get('tech_savviness', 0)}/5"),
+            ]),
+            ("Goals & Motivations", [
+                ("Goals", persona_data.get("goals")),
+                ("Motivations", persona_data.get("motivations")),
+            ]),
+            ("Pain Points", [
+                ("Frustrations", persona_data.get("frustrations")),
+                ("Challenges", persona_data.get("pain_points")),
+            ]),
+            ("Skills & Needs", [
+                ("Skills", persona_data.get("skills")),
+                ("Needs", persona_data.get("needs")),
+            ]),
+            ("Preferences", [
+                ("Interests", ", ".join(persona_data.get("interests") or []) or "None"),
+                ("Platforms", ", ".join(persona_data.get("platforms") or []) or "None"),
+            ]),
+        ]
+
+        for title, rows in sections:
+            pdf.set_x(18)
+            pdf.set_text_color(*style["accent"])
+            pdf.set_font("Helvetica", "B", 13)
+            pdf.cell(0, 8, title, new_x="LMARGIN", new_y="NEXT")
+            for label, value in rows:
+                pdf.set_x(18)
+                pdf.set_text_color(51, 51, 51)
+                pdf.set_font("Helvetica", "B", 10)
+                pdf.cell(32, 6, f"{label}:")
+                pdf.set_font("Helvetica", "", 10)
+                pdf.multi_cell(pdf.w - 18 - 32 - 18, 6, _latin1(value),
+                               new_x="LMARGIN", new_y="NEXT")
+            pdf.ln(3)
+
+        return bytes(pdf.output())
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_pdf_backend():
+    """Process-wide PDF backend picked by the PDF_BACKEND setting (pdfkit, pool or fpdf)"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            choice = str(get_setting("PDF_BACKEND", "pdfkit")).lower()
+            if choice == "pool":
+                _backend = PooledWkhtmltopdfBackend(
+                    size=get_int_setting("PDF_POOL_SIZE", 2),
+                    binary=get_setting("WKHTMLTOPDF_PATH", "wkhtmltopdf"),
+                    timeout=get_int_setting("PDF_RENDER_TIMEOUT", 60))
+            elif choice == "fpdf":
+                _backend = FpdfBackend()
+            else:
+                _backend = PdfkitBackend()
+        return _backend
@@ -0,0 +1,34 @@
+from app.services.pdf_backends import get_pdf_backend
+from app.utils.cache import BlobCache, content_digest
+from app.utils.config import get_setting, get_int_setting
+
+# Process-wide cache, shared by every Streamlit session
+pdf_cache = BlobCache(
+    "pdf",
+    max_items=get_int_setting("PDF_CACHE_MAX_ITEMS", 64),
+    disk_dir=get_setting("PDF_CACHE_DIR"),
+    max_disk_bytes=get_int_setting("PDF_CACHE_MAX_DISK_MB", 256) * 1024 * 1024,
+)
+
+
+def pdf_revision(*parts):
+    """Identity of a PDF export for the current backend.
+
+    Pass what already identifies the HTML, e.g. (persona.cache_key, template, photo
+    key), or the HTML itself, which embeds the fields, the markup and the photo.
+    """
+    return content_digest(get_pdf_backend().name, *parts)
+
+
+def render_pdf(html_content, persona_data=None, revision=None):
+    """Render HTML to PDF bytes, reusing a cached copy for the same revision
+    (by default that of the HTML content)"""
+    backend = get_pdf_backend()
+    if revision is None:
+        revision = pdf_revision(html_content)
+    return pdf_cache.get_or_create(
+        revision, lambda: backend.render(html_content, persona_data))
+
+
+def pdf_cache_stats():
+    return pdf_cache.stats()
@@ -0,0 +1,227 @@
+import threading
+
+from app.models.persona import GENDER_OPTIONS, INTEREST_OPTIONS, PLATFORM_OPTIONS, Gender, Persona
+from app.services.persona_store import get_persona_store
+
+# numpy is imported inside the functions, like the other heavy dependencies, so
+# pages that never show analytics don't pay for it on startup
+
+AGE_BINS = 10  # 0-9, 10-19, ... 90-100
+AGE_BIN_LABELS = [f"{start}-{start + 9}" for start in range(0, 90, 10)] + ["90-100"]
+
+
+def option_mask(values, options):
+    """Bitmask with bit i set for every options[i] among values"""
+    mask = 0
+    for value in values or ():
+        value = str(value)
+        if value in options:
+            mask |= 1 << options.index(value)
+    return mask
+
+
+def unpack_mask(masks, width):
+    """(n, width) 0/1 matrix of the bits in an array of bitmasks"""
+    import numpy as np
+
+    bits = np.arange(width, dtype=masks.dtype)
+    return ((masks[:, None] >> bits) & 1).astype(np.int32)
+
+
+class PersonaColumns:
+    """Personas as parallel NumPy arrays sorted by id, one row per persona.
+
+    Gender is an index into GENDER_OPTIONS, interests and platforms are bitmasks
+    over INTEREST_OPTIONS and PLATFORM_OPTIONS, so every aggregate is a bincount,
+    a sum or a matrix product over whole columns.
+
+    Arrays are never modified in place, upsert() swaps in new ones, so a snapshot()
+    stays consistent while the original keeps changing.
+    """
+
+    def __init__(self):
+        import numpy as np
+
+        self.ids = np.empty(0, np.int64)
+        self.age = np.empty(0, np.int16)
+        self.gender = np.empty(0, np.int8)
+        self.tech_savviness = np.empty(0, np.int8)
+        self.interests = np.empty(0, np.uint16)
+        self.platforms = np.empty(0, np.uint16)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def snapshot(self):
+        """Copy sharing the current arrays, unaffected by later upserts"""
+        columns = PersonaColumns.__new__(PersonaColumns)
+        columns.__dict__.update(self.__dict__)
+        return columns
+
+    @classmethod
+    def from_rows(cls, rows):
+        """From PersonaStore.analytics_rows() output"""
+        columns = cls()
+        columns.upsert(rows)
+        return columns
+
+    @classmethod
+    def from_personas(cls, personas):
+        columns = cls()
+        columns.add_personas(personas)
+        return columns
+
+    def add_personas(self, personas):
+        """Append Persona objects or persona dicts (e.g. a batch that was never saved),
+        numbered on from len(self)"""
+        gender_index = {gender: i for i, gender in enumerate(GENDER_OPTIONS)}
+        rows = []
+        for i, persona in enumerate(personas, start=len(self)):
+            persona = persona if isinstance(persona, Persona) else Persona.from_dict(persona)
+            rows.append((i, persona.age, gender_index[persona.gender.value], persona.tech_savviness,
+                         option_mask(persona.get("interests"), INTEREST_OPTIONS),
+                         option_mask(persona.get("platforms"), PLATFORM_OPTIONS)))
+        self.upsert(rows)
+
+    def upsert(self, rows):
+        """Merge (id, age, gender, tech_savviness, interests, platforms, ...) rows in:
+        ids already present are overwritten, new ones are added"""
+        import numpy as np
+
+        if not rows:
+            return
+        table = np.array([tuple(row)[:6] for row in rows], dtype=np.int64)
+        # An id listed twice: the last copy wins
+        ids, last = np.unique(table[::-1, 0], return_index=True)
+        table = table[::-1][last]
+
+        position = np.searchsorted(self.ids, ids)
+        found = position < len(self.ids)
+        found[found] = self.ids[position[found]] == ids[found]
+        names = ("age", "gender", "tech_savviness", "interests", "platforms")
+        if found.any():
+            for column, name in enumerate(names, start=1):
+                updated = getattr(self, name).copy()
+                updated[position[found]] = table[found, column]
+                setattr(self, name, updated)
+
+        new = table[~found]
+        if len(new):
+            merged_ids = np.concatenate([self.ids, new[:, 0]])
+            order = np.argsort(merged_ids, kind="stable")
+            self.ids = merged_ids[order]
+            for column, name in enumerate(names, start=1):
+                current = getattr(self, name)
+                setattr(self, name, np.concatenate([current, new[:, column].astype(current.dtype)])[order])
+
+    def summary(self, selection=None):
+        """Aggregates over all rows, or over a boolean `selection` of them"""
+        import numpy as np
+
+        def pick(column):
+            return column if selection is None else column[selection]
+
+        age = pick(self.age)
+        interests = unpack_mask(pick(self.interests), len(INTEREST_OPTIONS))
+        platforms = unpack_mask(pick(self.platforms), len(PLATFORM_OPTIONS))
+        count = len(age)
+        return {
+            "count": count,
+            "age_mean": float(age.mean()) if count else 0.0,
+            "age_median": float(np.median(age)) if count else 0.0,
+            "age_histogram": np.bincount(np.minimum(age // 10, AGE_BINS - 1), minlength=AGE_BINS),
+            "gender": np.bincount(pick(self.gender), minlength=len(GENDER_OPTIONS)),
+            "tech_savviness": np.bincount(pick(self.tech_savviness), minlength=6)[1:],
+            "tech_savviness_mean": float(pick(self.tech_savviness).mean()) if count else 0.0,
+            "interests": interests.sum(axis=0),
+            "platforms": platforms.sum(axis=0),
+            # [i, j] = personas with both option i and option j, the diagonal is the count
+            "interest_cooccurrence": interests.T @ interests,
+            "platform_cooccurrence": platforms.T @ platforms,
+            "interest_platform": interests.T @ platforms,
+        }
+
+    def select(self, gender=None, min_age=None, max_age=None, interest=None, platform=None):
+        """Boolean row selection for summary()"""
+        import numpy as np
+
+        selection = np.ones(len(self), dtype=bool)
+        if gender is not None:
+            selection &= self.gender == GENDER_OPTIONS.index(str(Gender.parse(gender) or gender))
+        if min_age is not None:
+            selection &= self.age >= min_age
+        if max_age is not None:
+            selection &= self.age <= max_age
+        if interest is not None:
+            selection &= (self.interests & (1 << INTEREST_OPTIONS.index(interest))) != 0
+        if platform is not None:
+            selection &= (self.platforms & (1 << PLATFORM_OPTIONS.index(platform))) != 0
+        return selection
+
+
+class LibraryAnalytics:
+    """PersonaColumns of the persona library, kept in step with it incrementally.
+
+    refresh() only reads rows saved since the last refresh (by change_seq). A full
+    reload happens on first use and when rows were deleted from the library.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.columns = None
+        self.version = 0
+        self.full_loads = 0
+        self._last_change = None
+        self._summary = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Pull new and updated personas from the store, return how many came in"""
+        with self._lock:
+            if self.columns is None:
+                return self._reload()
+            changed = self._merge(self.store.analytics_rows(changed_after=self._last_change))
+            if len(self.columns) != self.store.count():
+                return self._reload()
+            return changed
+
+    def _reload(self):
+        self.columns = PersonaColumns()
+        self._last_change = None
+        self.full_loads += 1
+        return self._merge(self.store.analytics_rows())
+
+    def _merge(self, rows):
+        if not rows:
+            return 0
+        self.columns.upsert(rows)
+        self._last_change = max(row[6] for row in rows)
+        self.version += 1
+        self._summary = None
+        return len(rows)
+
+    def snapshot(self):
+        """(columns, summary) of the library right now. The columns are a snapshot, so
+        select() and summary() on them stay consistent while other sessions refresh"""
+        self.refresh()
+        with self._lock:
+            if self._summary is None:
+                self._summary = self.columns.summary()
+            return self.columns.snapshot(), self._summary
+
+    def summary(self):
+        """Aggregates over the whole library, recomputed only after new rows came in"""
+        return self.snapshot()[1]
+
+
+_analytics = None
+_analytics_lock = threading.Lock()
+
+
+def get_library_analytics():
+    """Process-wide analytics over the persona library, shared by all sessions"""
+    global _analytics
+    with _analytics_lock:
+        if _analytics is None:
+            _analytics = LibraryAnalytics(get_persona_store())
+        return _analytics
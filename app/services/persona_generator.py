@@ -1,33 +1,20 @@
 import json
-import requests
-from io import BytesIO
-from PIL import Image
-import streamlit as st
-import google.generativeai as genai
-import base64
 
-from app.services.avatar_service import generate_ai_avatar_by_HFModels, generate_randomuserphotoByGender
+from app.models.persona import FIELDS as PERSONA_FIELDS
+from app.models.persona import GENDER_OPTIONS, INTEREST_OPTIONS, PLATFORM_OPTIONS, Gender, Persona
+from app.services.avatar_providers import generate_avatar, required_fields
+from app.services.job_runner import get_job_runner
+from app.utils.config import get_float_setting
+from app.services.llm_client import forget_reply, stream_generate
+from app.utils.json_stream import JsonStreamParser
 
 
-def generate_ai_persona():
-    try:
-        # Call the Model
-        model = genai.GenerativeModel("gemini-2.0-flash")
-
-        # Define allowed options (must match your form exactly)
-        interest_options = ["Technology", "Design", "Music", "Sports",
-                            "Reading", "Travel", "Gaming", "Fitness"]
-        platform_options = ["Mobile", "Desktop",
-                            "Tablet", "Smartwatch", "VR/AR"]
-        gender_options = ["Male", "Female", "Non-Binary", "Other"]
-
-        prompt = f"""Generate a realistic user persona with these REQUIREMENTS:
-        - Interests MUST be from: {", ".join(interest_options)}
-        - Platforms MUST be from: {", ".join(platform_options)}
-        - Gender MUST be from: {", ".join(gender_options)}
-        - Tech savviness MUST be 1-5
-        - Return valid JSON format like this example:
-        {{
+PERSONA_REQUIREMENTS = f"""- Interests MUST be from: {", ".join(INTEREST_OPTIONS)}
+        - Platforms MUST be from: {", ".join(PLATFORM_OPTIONS)}
+        - Gender MUST be from: {", ".join(GENDER_OPTIONS)}
+        - Tech savviness MUST be 1-5"""
+
+PERSONA_EXAMPLE = """{
             "name": "Alex Chen",
             "age": 28,
             "gender": "Non-Binary",
@@ -42,173 +29,134 @@ def generate_ai_persona():
             "tech_savviness": 4,
             "interests": ["Design", "Technology"],
             "platforms": ["Desktop", "Tablet"]
-        }}"""
-
-        response = model.generate_content(prompt)
-        response_text = response.text
-
-        # Clean JSON response
-        if response_text.startswith("```json"):
-            response_text = response_text[7:-3]  # Remove markdown wrappers
-        response_text = response_text.strip()
-
-        persona_data = json.loads(response_text)
-        # print(f"Generated Persona Data: {persona_data}")  # Add this line
-        # print(f"Generated Name: {persona_data.get('name')}")
-
-        # Update name
-        if "name" in persona_data:
-            st.session_state["name"] = persona_data["name"]
-            # print(f"Session State Name updated to: {st.session_state['name']}")
-
-        # Handle user-uploaded photo
-        uploaded_file = st.session_state.get("user_photo_file")
-        if uploaded_file is not None:
-            try:
-                st.info("Using uploaded photo...")
-                photo_bytes = uploaded_file.read()
-                st.session_state["user_photo"] = photo_bytes
-                print(
-                    f"User photo size (bytes) from upload in generate_ai: {len(photo_bytes)}")
-            except Exception as e:
-                st.error(f"Error reading uploaded file in generate_ai: {e}")
-                st.session_state["user_photo"] = None
-        else:
-            # Fetch user photo generation model
-            if st.session_state["selected_userphoto_modelgeneration"] == "randomuser":
-                # Random User Photo By Gender - Generation
-                generate_randomuserphotoByGender(persona_data["gender"])
-            elif st.session_state["selected_userphoto_modelgeneration"] == "stability":
-                # AI Photo Generation
-                generate_ai_avatar(
-                    persona_data["name"], persona_data["occupation"], persona_data["gender"])
-            else:
-                # Generate AI Photo using Hugging Face Models
-                generate_ai_avatar_by_HFModels()
-
-        # 1. Validate interests
-        if "interests" in persona_data:
-            if isinstance(persona_data["interests"], str):  # Handle string input
-                persona_data["interests"] = [x.strip()
-                                             for x in persona_data["interests"].split(",")]
-            valid_interests = [
-                i for i in persona_data["interests"]
-                if i in interest_options
-            ]
-            st.session_state["interests"] = valid_interests or []
-
-        # 2. Validate platforms
-        if "platforms" in persona_data:
-            if isinstance(persona_data["platforms"], str):  # Handle string input
-                persona_data["platforms"] = [x.strip()
-                                             for x in persona_data["platforms"].split(",")]
-            valid_platforms = [
-                p for p in persona_data["platforms"]
-                if p in platform_options
-            ]
-            st.session_state["platforms"] = valid_platforms or []
-
-        # 3. Validate gender
-        if "gender" in persona_data:
-            if persona_data["gender"] not in gender_options:
-                persona_data["gender"] = "Other"
-
-        # 4. Validate tech savviness
-        if "tech_savviness" in persona_data:
-            try:
-                ts = int(persona_data["tech_savviness"])
-                persona_data["tech_savviness"] = max(1, min(5, ts))
-            except (ValueError, TypeError):
-                persona_data["tech_savviness"] = 3
-
-        # Update all valid fields
-        for field in ["name", "age", "gender", "occupation", "location",
-                      "goals", "frustrations", "motivations", "needs",
-                      "skills", "pain_points", "tech_savviness"]:
-            if field in persona_data:
-                st.session_state[field] = persona_data[field]
-
-        # Store success state and trigger rerun
-        # st.session_state["ai_generation_success"] = True
-        # st.session_state.pop("ai_generation_success",
-        #                      None)  # Remove the old flag
-        st.session_state["submitted"] = True
-
-        st.rerun()  # ← THIS IS THE CRUCIAL LINE TO ADD
+        }"""
 
-    except json.JSONDecodeError:
-        st.error("Invalid JSON response from AI. Raw response:")
-        st.code(response_text)
-    except requests.exceptions.RequestException as e:
-        st.error(f"Error communicating with Random User API: {e}")
-    except Exception as e:
-        st.error(f"AI generation failed: {str(e)}")
+
+def build_persona_prompt():
+    return f"""Generate a realistic user persona with these REQUIREMENTS:
+        {PERSONA_REQUIREMENTS}
+        - Return valid JSON format like this example:
+        {PERSONA_EXAMPLE}"""
+
+
+def build_persona_array_prompt(count):
+    # One request for many personas: the schema and option lists are only sent once
+    return f"""Generate {count} distinct, realistic user personas with these REQUIREMENTS:
+        {PERSONA_REQUIREMENTS}
+        - Vary names, ages, genders, occupations and locations across personas
+        - Return ONLY a valid JSON array of {count} objects, each like this example:
+        [{PERSONA_EXAMPLE}]"""
 
 
-def generate_ai_avatar(name, occupation, gender):
-    """Generate professional avatar using Stability AI with gender consistency"""
+def validate_persona(persona_data, partial=False):
+    """Normalize raw model output into a plain persona dict that matches the form.
+
+    With partial=True only the fields present so far are returned (used while streaming),
+    otherwise missing fields get their form defaults.
+    """
+    return {field: _plain(Persona.normalize(field, persona_data.get(field)))
+            for field in PERSONA_FIELDS if not partial or field in persona_data}
+
+
+def _plain(value):
+    # Enums and tuples back to the str/list shapes JSON and the widgets expect
+    if isinstance(value, tuple):
+        return [str(item) for item in value]
+    return value.value if isinstance(value, Gender) else value
+
+
+def generate_persona_data(model=None, on_field=None, seed=None):
+    """Ask Gemini for one persona and return it validated, without touching session state.
+
+    on_field(key, value) is called for every field as soon as it has streamed in.
+    With a seed the reply may come from (or be shared with) identical requests,
+    see llm_client.stream_generate.
+    Raises json.JSONDecodeError (with the raw reply in .doc) on unusable output.
+    """
+    prompt = build_persona_prompt()
+    parser = JsonStreamParser()
+    for chunk_text in stream_generate(prompt, model, seed=seed):
+        for key, value in parser.feed(chunk_text):
+            if on_field is not None:
+                on_field(key, value)
+
     try:
-        stability_key = st.secrets.get("STABILITY_API_KEY")
-        if not stability_key:
-            st.error("Missing Stability API key in secrets.toml")
-            return None
-
-        # Enhanced prompt with strict gender control
-        prompt = f"""
-        Professional corporate headshot of {name}, {gender.lower()} {occupation.lower()}.
-        Hyper-realistic studio portrait with:
-        - Strictly {gender.lower()}-appearing subject
-        - {gender}-appropriate business attire
-        - Neutral gray background
-        - High detail (512x512 resolution)
-        - Professional hairstyle
-        - Confident expression
-        
-        Technical requirements:
-        - Photorealistic style
-        - No artistic filters
-        - No visible jewelry (unless culturally appropriate)
-        - Crisp focus on facial features
-        """
-
-        # Gender-specific negative prompts
-        negative_prompt = (
-            "woman, female, makeup, dress, earrings" if gender == "Male"
-            else "man, male, beard, mustache" if gender == "Female"
-            else "gender-stereotypical"
-        ) + ", cartoon, anime, blurry, deformed, text, watermark"
-
-        response = requests.post(
-            url="https://api.stability.ai/v2beta/stable-image/generate/core",
-            headers={"Authorization": f"Bearer {stability_key}",
-                     "Accept": "image/*"},
-            files={"none": ''},
-            data={
-                "prompt": prompt,
-                "negative_prompt": negative_prompt,
-                "output_format": "png",
-                "width": "512",
-                "height": "512",
-                "seed": 42,  # For more consistent results
-            },
-            timeout=10  # Add timeout
-        )
-        response.raise_for_status()
-
-        # Process image
-        img = Image.open(BytesIO(response.content))
-
-        # Convert to square thumbnail
-        img = img.resize((256, 256))  # Standardize size
-        buffer = BytesIO()
-        img.save(buffer, format="PNG", quality=95)
-
-        return buffer.getvalue()
-
-    except requests.exceptions.RequestException as e:
-        st.error(f"API Error: {str(e)}")
-    except Exception as e:
-        st.error(f"Generation Failed: {str(e)}")
-
-    st.session_state["user_photo"] = None
-    return None
+        if parser.done:
+            persona_data = parser.document()
+        else:
+            response_text = parser.text
+            # Clean JSON response
+            if response_text.startswith("```json"):
+                response_text = response_text[7:-3]  # Remove markdown wrappers
+            persona_data = json.loads(response_text.strip())
+
+        if not isinstance(persona_data, dict):
+            raise json.JSONDecodeError(
+                "Expected a JSON object", parser.text, 0)
+    except json.JSONDecodeError:
+        # Don't keep serving a broken reply from the cache
+        forget_reply(prompt, model, seed=seed)
+        raise
+    return validate_persona(persona_data)
+
+
+def generate_persona_array(count, model=None):
+    """Ask Gemini for `count` personas in a single request.
+
+    Yields each persona validated as soon as its array element has streamed in;
+    elements that are not objects are skipped, so fewer than `count` may come back,
+    and never more: extra elements the model adds are dropped.
+    """
+    parser = JsonStreamParser()
+    yielded = 0
+    for chunk_text in stream_generate(build_persona_array_prompt(count), model):
+        for _, item in parser.feed(chunk_text):
+            if isinstance(item, dict):
+                yield validate_persona(item)
+                yielded += 1
+                if yielded >= count:
+                    return
+        if parser.done:
+            break
+
+
+def fetch_avatar(provider, fields, secrets):
+    """Fetch an avatar starting with the given provider (falling back along the chain), returns image bytes"""
+    fields = dict(fields)
+    if fields.get("gender") not in GENDER_OPTIONS:
+        fields["gender"] = "Other"
+    return generate_avatar(fields, secrets, preferred=provider)
+
+
+def start_avatar_generation(provider, fields, secrets):
+    """Start the avatar for the selected provider as a background job, returns the Job"""
+    # Avatars run while Gemini is still streaming the rest of the persona
+    return get_job_runner().submit(fetch_avatar, provider, dict(fields), secrets,
+                                   deadline=get_float_setting("AVATAR_JOB_DEADLINE", 300.0))
+
+
+def generate_persona_with_avatar(provider=None, secrets=None, seed=None, on_partial=None):
+    """Generate one persona and its avatar, returns (persona_data, avatar Job or None).
+
+    The avatar job starts as soon as the fields its provider needs have streamed in,
+    so it runs while Gemini is still writing the rest. on_partial(persona) receives
+    the validated fields received so far every time another one streams in.
+    """
+    secrets = secrets or {}
+    needed_fields = required_fields(provider, secrets) if provider else ()
+    fields = {}
+    avatar_job = None
+
+    def on_field(key, value):
+        nonlocal avatar_job
+        fields[key] = value
+        if on_partial is not None:
+            on_partial(validate_persona(fields, partial=True))
+        if provider and avatar_job is None and all(f in fields for f in needed_fields):
+            # Raw streamed values may be null or not strings, the prompts need clean ones
+            avatar_job = start_avatar_generation(provider, validate_persona(fields, partial=True), secrets)
+
+    persona_data = generate_persona_data(on_field=on_field, seed=seed)
+    if provider and avatar_job is None:
+        avatar_job = start_avatar_generation(provider, persona_data, secrets)
+    return persona_data, avatar_job
@@ -0,0 +1,134 @@
+# Streamlit side of persona generation: the session's persona, its avatar job and the
+# "Generate using AI" flow. app.services.persona_generator never touches Streamlit, so
+# the HTTP API and batch runs share it
+import json
+import streamlit as st
+from uuid import uuid4
+
+from app.models.persona import Persona
+from app.services.job_runner import get_job_runner
+from app.services.llm_client import pick_seed
+from app.services.persona_generator import generate_persona_with_avatar
+from app.services.rate_limiter import RateLimitTimeout, rate_limit_context
+from app.utils.config import get_float_setting
+
+
+def collect_avatar_job():
+    """Move a finished avatar job's result into the session, True once there is nothing left to wait for"""
+    job_id = st.session_state.get("avatar_job")
+    if job_id is None:
+        return True
+    job = get_job_runner().get(job_id)
+    if job is not None and not job.done():
+        return False
+
+    st.session_state.pop("avatar_job", None)
+    persona = session_persona()
+    if job is None:
+        persona.update(user_photo=None)  # Expired or lost with a server restart
+    elif job.status == "done":
+        persona.update(user_photo=job.result)
+    else:
+        st.error(f"Avatar generation failed: {job.error}")
+        persona.update(user_photo=None)
+    return True
+
+
+def avatar_job_status():
+    """Snapshot of the session's pending avatar job, None when there is none"""
+    job_id = st.session_state.get("avatar_job")
+    job = get_job_runner().get(job_id) if job_id else None
+    return job.snapshot() if job is not None else None
+
+
+def session_persona():
+    """The Persona being edited in this session"""
+    persona = st.session_state.get("persona")
+    if persona is None:
+        persona = st.session_state["persona"] = Persona()
+    return persona
+
+
+def session_id():
+    """Stable id of the current Streamlit session, used for fair queueing"""
+    return st.session_state.setdefault("_session_id", uuid4().hex)
+
+
+def generate_ai_persona(on_partial=None):
+    """Generate a persona into the session state.
+
+    on_partial(persona) receives the validated fields received so far every time
+    another one streams in, so the caller can paint a live preview.
+    """
+    import requests
+
+    # Shown while this session waits in line for the shared Gemini/image quotas
+    wait_notice = st.empty()
+
+    def on_wait(position, seconds):
+        wait_notice.info(f"High demand right now: #{position + 1} in line, about {seconds:.0f}s to go")
+
+    try:
+        with rate_limit_context(session=session_id(), on_wait=on_wait):
+            # Handle user-uploaded photo, otherwise an avatar is generated alongside the text
+            uploaded_file = st.session_state.get("user_photo_file")
+            provider = None
+            if uploaded_file is None:
+                provider = st.session_state["selected_userphoto_modelgeneration"]
+                if provider == "stability" and not st.secrets.get("STABILITY_API_KEY"):
+                    st.warning(
+                        "Missing Stability API key in secrets.toml, using another provider")
+            # Secrets are read here, worker threads must not touch Streamlit
+            secrets = {key: st.secrets.get(key)
+                       for key in ("STABILITY_API_KEY", "HUGGINGFACE_TOKEN")} if provider else {}
+
+            # A random variant seed lets repeat clicks reuse cached replies without
+            # everyone getting the same persona. The avatar starts as soon as the
+            # fields it needs have streamed in
+            persona_data, avatar_job = generate_persona_with_avatar(
+                provider, secrets, seed=pick_seed(), on_partial=on_partial)
+            wait_notice.empty()
+
+            persona = session_persona()
+            if uploaded_file is not None:
+                try:
+                    st.info("Using uploaded photo...")
+                    photo_bytes = uploaded_file.read()
+                    persona.update(user_photo=photo_bytes)
+                    print(
+                        f"User photo size (bytes) from upload in generate_ai: {len(photo_bytes)}")
+                except Exception as e:
+                    st.error(f"Error reading uploaded file in generate_ai: {e}")
+                    persona.update(user_photo=None)
+
+            # Update all valid fields. It is a new persona now, saving it must not
+            # overwrite the library entry that was loaded into the form
+            persona.update(**persona_data)
+            persona.library_id = None
+
+            # The avatar has been generating in the meantime. Give it a short grace
+            # period, after that the preview polls for it instead of blocking this script
+            if avatar_job is not None:
+                st.session_state["avatar_job"] = avatar_job.id
+                persona.update(user_photo=None)
+                avatar_job.wait(get_float_setting("AVATAR_JOB_GRACE", 1.0))
+                collect_avatar_job()
+
+            # Store success state and trigger rerun
+            # st.session_state["ai_generation_success"] = True
+            # st.session_state.pop("ai_generation_success",
+            #                      None)  # Remove the old flag
+            st.session_state["submitted"] = True
+
+            st.rerun()  # ← THIS IS THE CRUCIAL LINE TO ADD
+
+    except RateLimitTimeout as e:
+        st.warning(f"Too many requests right now, please try again in a moment ({e})")
+    except json.JSONDecodeError as e:
+        st.error("Invalid JSON response from AI. Raw response:")
+        st.code(e.doc)
+    except requests.exceptions.RequestException as e:
+        st.error(f"Error communicating with Random User API: {e}")
+    except Exception as e:
+        st.error(f"AI generation failed: {str(e)}")
+
@@ -0,0 +1,392 @@
+import os
+import sqlite3
+import threading
+import time
+
+from app.models.persona import FIELDS, GENDER_OPTIONS, INTEREST_OPTIONS, PLATFORM_OPTIONS, Gender, Persona
+from app.utils.cache import content_digest
+from app.utils.config import get_setting
+from app.utils.dedup import (DEDUP_FIELDS, band_keys, dedup_threshold, pack_signature, persona_signature,
+                             similarity, unpack_signature)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS photos (
+    digest TEXT PRIMARY KEY,
+    data BLOB NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS personas (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    age INTEGER NOT NULL,
+    gender TEXT NOT NULL,
+    occupation TEXT NOT NULL COLLATE NOCASE,
+    location TEXT NOT NULL,
+    goals TEXT NOT NULL,
+    frustrations TEXT NOT NULL,
+    motivations TEXT NOT NULL,
+    needs TEXT NOT NULL,
+    skills TEXT NOT NULL,
+    pain_points TEXT NOT NULL,
+    tech_savviness INTEGER NOT NULL,
+    template TEXT NOT NULL DEFAULT 'basic',
+    photo_digest TEXT REFERENCES photos(digest),
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    -- Increases with every save across the library, readers catch up with "> last seen"
+    change_seq INTEGER NOT NULL DEFAULT 0
+);
+
+-- One row per option, so "has interest X" is an index lookup instead of a LIKE scan
+CREATE TABLE IF NOT EXISTS persona_interests (
+    interest TEXT NOT NULL,
+    persona_id INTEGER NOT NULL REFERENCES personas(id) ON DELETE CASCADE,
+    PRIMARY KEY (interest, persona_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS persona_platforms (
+    platform TEXT NOT NULL,
+    persona_id INTEGER NOT NULL REFERENCES personas(id) ON DELETE CASCADE,
+    PRIMARY KEY (platform, persona_id)
+) WITHOUT ROWID;
+
+-- MinHash signature of the free text and its LSH buckets, for near-duplicate lookups
+CREATE TABLE IF NOT EXISTS persona_signatures (
+    persona_id INTEGER PRIMARY KEY REFERENCES personas(id) ON DELETE CASCADE,
+    signature BLOB NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS persona_lsh (
+    band INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    persona_id INTEGER NOT NULL REFERENCES personas(id) ON DELETE CASCADE,
+    PRIMARY KEY (band, bucket, persona_id)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS personas_occupation ON personas(occupation);
+CREATE INDEX IF NOT EXISTS personas_age ON personas(age);
+CREATE INDEX IF NOT EXISTS personas_gender ON personas(gender);
+CREATE INDEX IF NOT EXISTS personas_tech_savviness ON personas(tech_savviness);
+CREATE INDEX IF NOT EXISTS personas_photo ON personas(photo_digest);
+CREATE INDEX IF NOT EXISTS persona_interests_persona ON persona_interests(persona_id);
+CREATE INDEX IF NOT EXISTS persona_platforms_persona ON persona_platforms(persona_id);
+CREATE INDEX IF NOT EXISTS persona_lsh_persona ON persona_lsh(persona_id);
+"""
+
+# What a result page shows, the long text fields and the photo are only read on load
+SUMMARY_COLUMNS = ("id", "name", "age", "gender", "occupation", "location",
+                   "tech_savviness", "template", "updated_at")
+
+
+class DuplicatePersonaError(Exception):
+    """A near-identical persona is already in the library"""
+
+    def __init__(self, duplicate_of, similarity):
+        self.duplicate_of = duplicate_of
+        self.similarity = similarity
+        super().__init__(f"Persona is {similarity:.0%} similar to library persona {duplicate_of}")
+
+
+def _like_prefix(text):
+    escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return escaped + "%"
+
+
+class PersonaStore:
+    """Persona library in SQLite (WAL mode, so readers never wait for a writer).
+
+    Photos are stored once per content digest and referenced from the persona
+    row. Every thread gets its own connection.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._write_lock:
+            connection = self._connection()
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+            self._migrate(connection)
+            self._index_unsigned(connection)
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            # WAL makes NORMAL durable enough: a crash can only lose the last commits
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA foreign_keys=ON")
+            self._local.connection = connection
+        return connection
+
+    def _migrate(self, connection):
+        columns = [row["name"] for row in connection.execute("PRAGMA table_info(personas)")]
+        if "change_seq" not in columns:
+            connection.execute("ALTER TABLE personas ADD COLUMN change_seq INTEGER NOT NULL DEFAULT 0")
+            connection.execute("UPDATE personas SET change_seq = id")
+        connection.execute("CREATE INDEX IF NOT EXISTS personas_change_seq ON personas(change_seq)")
+
+    def _index_unsigned(self, connection):
+        # Libraries created before near-duplicate detection get their signatures once
+        rows = connection.execute(
+            f"SELECT id, {', '.join(DEDUP_FIELDS)} FROM personas "
+            "WHERE id NOT IN (SELECT persona_id FROM persona_signatures)").fetchall()
+        if rows:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                for row in rows:
+                    self._index_signature(connection, row["id"], persona_signature(dict(row)))
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+
+    def _index_signature(self, connection, library_id, signature):
+        connection.execute("DELETE FROM persona_lsh WHERE persona_id = ?", (library_id,))
+        # Personas without any free text get an empty signature and never match
+        connection.execute("INSERT OR REPLACE INTO persona_signatures (persona_id, signature) VALUES (?, ?)",
+                           (library_id, pack_signature(signature or ())))
+        if signature is not None:
+            connection.executemany("INSERT OR IGNORE INTO persona_lsh (band, bucket, persona_id) VALUES (?, ?, ?)",
+                                   [(band, bucket, library_id) for band, bucket in band_keys(signature)])
+
+    def find_duplicate(self, persona, threshold=None, signature=None):
+        """(library id, similarity) of the closest near-duplicate of `persona`, or None.
+
+        Only personas sharing an LSH bucket with it are compared, so the lookup cost
+        does not grow with the size of the library.
+        """
+        signature = signature or persona_signature(persona)
+        if signature is None:
+            return None
+        threshold = dedup_threshold() if threshold is None else threshold
+        keys = list(band_keys(signature))
+        matches = " OR ".join(["(band = ? AND bucket = ?)"] * len(keys))
+        rows = self._connection().execute(
+            "SELECT persona_id, signature FROM persona_signatures WHERE persona_id IN "
+            f"(SELECT persona_id FROM persona_lsh WHERE {matches})",
+            [value for key in keys for value in key]).fetchall()
+        best = None
+        for library_id, packed in rows:
+            if library_id == getattr(persona, "library_id", None):  # Batch personas are dicts
+                continue
+            score = similarity(signature, unpack_signature(packed))
+            if score >= threshold and (best is None or score > best[1]):
+                best = (library_id, score)
+        return best
+
+    def save(self, persona, template="basic", reject_duplicates=False):
+        """Insert or update a Persona, return its library id.
+
+        With reject_duplicates a near-duplicate already in the library raises
+        DuplicatePersonaError instead.
+        """
+        if reject_duplicates:
+            duplicate = self.find_duplicate(persona)
+            if duplicate is not None:
+                raise DuplicatePersonaError(*duplicate)
+        return self.save_many([persona], template)[0]
+
+    def save_many(self, personas, template="basic", skip_duplicates=False):
+        """Save several personas in one transaction, return their library ids.
+
+        With skip_duplicates, personas that nearly duplicate one in the library (or
+        an earlier one of this call) are not saved and get None as their id.
+        """
+        connection = self._connection()
+        ids = []
+        with self._write_lock:
+            connection.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            try:
+                change_seq = connection.execute("SELECT MAX(change_seq) FROM personas").fetchone()[0] or 0
+                for persona in personas:
+                    signature = persona_signature(persona)
+                    if skip_duplicates and self.find_duplicate(persona, signature=signature):
+                        ids.append(None)
+                        continue
+                    change_seq += 1
+                    ids.append(self._save(connection, persona, template, now, signature, change_seq))
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        for persona, library_id in zip(personas, ids):
+            if library_id is not None:
+                persona.library_id = library_id
+        return ids
+
+    def _save(self, connection, persona, template, now, signature, change_seq):
+        photo_digest = None
+        if persona.user_photo:
+            photo_digest = content_digest(persona.user_photo)
+            connection.execute("INSERT OR IGNORE INTO photos (digest, data) VALUES (?, ?)",
+                               (photo_digest, persona.user_photo))
+
+        values = {field: persona.get(field) for field in FIELDS
+                  if field not in ("interests", "platforms")}
+        values.update(template=template, photo_digest=photo_digest, updated_at=now, change_seq=change_seq)
+        library_id = persona.library_id
+        old_photo = None
+        if library_id is not None:
+            row = connection.execute("SELECT photo_digest FROM personas WHERE id = ?",
+                                     (library_id,)).fetchone()
+            old_photo = row[0] if row else None
+            assignments = ", ".join(f"{column} = :{column}" for column in values)
+            updated = connection.execute(
+                f"UPDATE personas SET {assignments} WHERE id = :id", dict(values, id=library_id))
+            if not updated.rowcount:
+                library_id = None  # Deleted from the library meanwhile, save it as new
+        if library_id is None:
+            values["created_at"] = now
+            columns = ", ".join(values)
+            library_id = connection.execute(
+                f"INSERT INTO personas ({columns}) VALUES ({', '.join(':' + c for c in values)})",
+                values).lastrowid
+
+        for table, column, options in (("persona_interests", "interest", persona.interests),
+                                       ("persona_platforms", "platform", persona.platforms)):
+            connection.execute(f"DELETE FROM {table} WHERE persona_id = ?", (library_id,))
+            connection.executemany(f"INSERT INTO {table} ({column}, persona_id) VALUES (?, ?)",
+                                   [(option.value, library_id) for option in options])
+        self._index_signature(connection, library_id, signature)
+        if old_photo != photo_digest:
+            self._release_photo(connection, old_photo)
+        return library_id
+
+    def _release_photo(self, connection, digest):
+        # Photos are shared by content, only drop one nobody references any more
+        if digest is not None:
+            connection.execute("DELETE FROM photos WHERE digest = ? AND NOT EXISTS "
+                               "(SELECT 1 FROM personas WHERE photo_digest = ?)", (digest, digest))
+
+    def load(self, library_id):
+        """(Persona with its photo, template) for a library id, None when it is gone"""
+        connection = self._connection()
+        row = connection.execute(
+            "SELECT personas.*, photos.data AS user_photo FROM personas "
+            "LEFT JOIN photos ON photos.digest = personas.photo_digest WHERE id = ?",
+            (library_id,)).fetchone()
+        if row is None:
+            return None
+        fields = {field: row[field] for field in FIELDS if field not in ("interests", "platforms")}
+        fields["interests"] = [r[0] for r in connection.execute(
+            "SELECT interest FROM persona_interests WHERE persona_id = ?", (library_id,))]
+        fields["platforms"] = [r[0] for r in connection.execute(
+            "SELECT platform FROM persona_platforms WHERE persona_id = ?", (library_id,))]
+        fields["user_photo"] = row["user_photo"]
+        persona = Persona.from_dict(fields)
+        persona.library_id = library_id
+        return persona, row["template"]
+
+    def delete(self, library_id):
+        connection = self._connection()
+        with self._write_lock:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = connection.execute("SELECT photo_digest FROM personas WHERE id = ?",
+                                         (library_id,)).fetchone()
+                connection.execute("DELETE FROM personas WHERE id = ?", (library_id,))
+                self._release_photo(connection, row[0] if row else None)
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+
+    def _where(self, occupation=None, gender=None, min_age=None, max_age=None,
+               tech_savviness=None, interests=(), platforms=()):
+        clauses, params = [], []
+        if occupation:
+            # Prefix match, served by the NOCASE occupation index
+            clauses.append("occupation LIKE ? ESCAPE '\\'")
+            params.append(_like_prefix(occupation.strip()))
+        if gender:
+            clauses.append("gender = ?")
+            params.append(str(Gender.parse(gender) or gender))
+        if min_age is not None:
+            clauses.append("age >= ?")
+            params.append(int(min_age))
+        if max_age is not None:
+            clauses.append("age <= ?")
+            params.append(int(max_age))
+        if tech_savviness:
+            clauses.append("tech_savviness = ?")
+            params.append(int(tech_savviness))
+        # Every selected option must be present
+        for table, column, options in (("persona_interests", "interest", interests),
+                                       ("persona_platforms", "platform", platforms)):
+            for option in options or ():
+                clauses.append(f"id IN (SELECT persona_id FROM {table} WHERE {column} = ?)")
+                params.append(str(option))
+        return clauses, params
+
+    def search(self, limit=20, after_id=None, **filters):
+        """One page of persona summaries, newest first, and the cursor for the next page.
+
+        Pages are keyed on the last id seen (not OFFSET), so page 500 costs the same as
+        page 1. Pass the returned cursor as after_id, it is None on the last page.
+        """
+        clauses, params = self._where(**filters)
+        if after_id is not None:
+            clauses.append("id < ?")
+            params.append(after_id)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._connection().execute(
+            f"SELECT {', '.join(SUMMARY_COLUMNS)} FROM personas {where} ORDER BY id DESC LIMIT ?",
+            params + [limit + 1]).fetchall()
+        page = [dict(row) for row in rows[:limit]]
+        next_cursor = page[-1]["id"] if len(rows) > limit else None
+        return page, next_cursor
+
+    def count(self, **filters):
+        clauses, params = self._where(**filters)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._connection().execute(f"SELECT COUNT(*) FROM personas {where}", params).fetchone()[0]
+
+    def analytics_rows(self, changed_after=None):
+        """(id, age, gender index, tech_savviness, interests mask, platforms mask, change_seq)
+        for every persona saved after the `changed_after` change_seq.
+
+        The option fields come back as bitmasks over the option lists (bit i set for
+        option i), built by SQLite, for app.services.persona_analytics.
+        """
+        params = list(GENDER_OPTIONS)
+        gender = " ".join(f"WHEN ? THEN {i}" for i in range(len(GENDER_OPTIONS)))
+        masks = []
+        for table, column, options in (("persona_interests", "interest", INTEREST_OPTIONS),
+                                       ("persona_platforms", "platform", PLATFORM_OPTIONS)):
+            bits = " ".join(f"WHEN ? THEN {1 << i}" for i in range(len(options)))
+            masks.append(f"(SELECT COALESCE(SUM(CASE {column} {bits} ELSE 0 END), 0) "
+                         f"FROM {table} WHERE persona_id = personas.id)")
+            params += options
+        where = ""
+        if changed_after is not None:
+            where = "WHERE change_seq > ?"
+            params.append(changed_after)
+        return self._connection().execute(
+            f"SELECT id, age, CASE gender {gender} ELSE {GENDER_OPTIONS.index(Gender.OTHER.value)} END, "
+            f"tech_savviness, {masks[0]}, {masks[1]}, change_seq FROM personas {where}",
+            params).fetchall()
+
+    def occupations(self, limit=50):
+        """Most common occupations, for filter suggestions"""
+        return [row[0] for row in self._connection().execute(
+            "SELECT occupation FROM personas GROUP BY occupation ORDER BY COUNT(*) DESC LIMIT ?",
+            (limit,))]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_persona_store():
+    """Process-wide persona library at PERSONA_DB_PATH"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = PersonaStore(get_setting("PERSONA_DB_PATH", os.path.join("data", "personas.db")))
+        return _store
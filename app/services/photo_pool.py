@@ -0,0 +1,95 @@
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from app.services.avatar_service import fetch_randomuser_photo, fetch_randomuser_photos
+from app.services.rate_limiter import current_lane
+from app.utils.config import get_int_setting
+
+logger = logging.getLogger(__name__)
+
+
+def pool_key(gender):
+    # randomuser.me only knows male/female, anything else gets a random face
+    gender = (gender or "").lower()
+    return gender if gender in ("male", "female") else "any"
+
+
+class RandomUserPhotoPool:
+    """Per-gender pools of ready-to-use randomuser photos, refilled in the background"""
+
+    def __init__(self, capacity=6, low_water=2, batch_size=3):
+        self.capacity = capacity
+        self.low_water = low_water
+        self.batch_size = batch_size
+        self._pools = {key: deque() for key in ("male", "female", "any")}
+        self._refilling = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix="photo-pool")
+        self.hits = 0
+        self.misses = 0
+
+    def pop(self, gender):
+        """A pooled photo for this gender, or None when the pool is empty (O(1), no I/O)"""
+        key = pool_key(gender)
+        with self._lock:
+            pool = self._pools[key]
+            photo = pool.popleft() if pool else None
+            if photo is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            self._maybe_refill(key)
+        return photo
+
+    def get(self, gender):
+        """Pooled photo if available, otherwise a live fetch"""
+        return self.pop(gender) or fetch_randomuser_photo(gender)
+
+    def warm(self):
+        with self._lock:
+            for key in self._pools:
+                self._maybe_refill(key)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    **{f"{key}_ready": len(pool) for key, pool in self._pools.items()}}
+
+    # Caller holds the lock
+    def _maybe_refill(self, key):
+        if self.capacity <= 0 or key in self._refilling:
+            return
+        if len(self._pools[key]) < self.low_water:
+            self._refilling.add(key)
+            self._executor.submit(self._refill, key)
+
+    def _refill(self, key):
+        # Prefetching is background work, it must not hold up users waiting on a photo
+        current_lane.set("batch")
+        try:
+            while True:
+                with self._lock:
+                    missing = self.capacity - len(self._pools[key])
+                if missing <= 0:
+                    break
+                photos = fetch_randomuser_photos(
+                    None if key == "any" else key, min(self.batch_size, missing))
+                with self._lock:
+                    self._pools[key].extend(photos[:max(0, self.capacity - len(self._pools[key]))])
+        except Exception as e:
+            # The request path falls back to a live fetch, so just note it
+            logger.warning("Refilling %s photo pool failed: %s", key, e)
+        finally:
+            with self._lock:
+                self._refilling.discard(key)
+
+
+# Process-wide pool, RANDOMUSER_POOL_SIZE=0 disables prefetching
+photo_pool = RandomUserPhotoPool(
+    capacity=get_int_setting("RANDOMUSER_POOL_SIZE", 6),
+    low_water=get_int_setting("RANDOMUSER_POOL_LOW_WATER", 2),
+    batch_size=get_int_setting("RANDOMUSER_POOL_BATCH", 3),
+)
@@ -0,0 +1,254 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from app.utils.config import get_float_setting, get_int_setting
+
+# Lower number is served first
+LANES = {"interactive": 0, "batch": 1}
+
+# Requests per minute per external service, 0 means unlimited. Each can be
+# overridden with <SERVICE>_RPM and <SERVICE>_BURST
+SERVICE_LIMITS = {
+    "gemini": {"rpm": 60, "burst": 5},
+    "huggingface": {"rpm": 60, "burst": 5},
+    "stability": {"rpm": 150, "burst": 10},
+    "randomuser": {"rpm": 0, "burst": 10},
+}
+
+# Who is asking, propagated to worker threads with contextvars.copy_context()
+current_session = ContextVar("rate_limit_session", default=None)
+current_lane = ContextVar("rate_limit_lane", default="interactive")
+# (thread id, callback): only the thread that set it may call back, so worker
+# threads never touch Streamlit widgets
+current_wait_callback = ContextVar("rate_limit_wait_callback", default=None)
+
+
+class RateLimitTimeout(Exception):
+    """The estimated wait for a slot is longer than the caller is willing to wait"""
+
+    def __init__(self, service, estimated_wait):
+        self.service = service
+        self.estimated_wait = estimated_wait
+        super().__init__(f"{service} is at capacity, estimated wait {estimated_wait:.0f}s")
+
+
+def is_rate_limited(error):
+    # google.api_core raises ResourceExhausted (HTTP 429), requests raises HTTPError
+    if type(error).__name__ in ("ResourceExhausted", "TooManyRequests"):
+        return True
+    if getattr(error, "code", None) == 429:
+        return True
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None) == 429
+
+
+@contextmanager
+def rate_limit_context(session=None, lane=None, on_wait=None):
+    """Tag calls made inside the block with a session, a lane and a wait callback.
+
+    on_wait(position, estimated_seconds) is called while this thread waits in line.
+    """
+    tokens = []
+    if session is not None:
+        tokens.append((current_session, current_session.set(session)))
+    if lane is not None:
+        tokens.append((current_lane, current_lane.set(lane)))
+    if on_wait is not None:
+        tokens.append((current_wait_callback,
+                       current_wait_callback.set((threading.get_ident(), on_wait))))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+class _Ticket:
+    __slots__ = ("session", "lane")
+
+    def __init__(self, session, lane):
+        self.session = session
+        self.lane = lane
+
+
+class FairRateLimiter:
+    """Token bucket shared by every session, handing out tokens through a fair queue.
+
+    Waiters are served by lane priority (interactive before batch), and round-robin
+    across sessions within a lane, so one session's batch cannot starve the others.
+    A 429 from the service pauses the whole bucket instead of letting every caller
+    retry into the limit on its own.
+    """
+
+    def __init__(self, name, requests_per_minute, burst=5, max_wait=None):
+        self.name = name
+        # Longest an interactive caller is kept waiting, batch work waits as long as it takes
+        self.max_wait = max_wait
+        self.rate = requests_per_minute / 60.0
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._queues = {lane: OrderedDict() for lane in LANES}
+        self._condition = threading.Condition()
+
+        self.granted = 0
+        self.throttled = 0
+        self.total_wait = 0.0
+
+    @property
+    def unlimited(self):
+        return self.rate <= 0
+
+    # Caller holds the lock for the helpers below
+    def _refill(self):
+        now = time.monotonic()
+        if now > self._paused_until:
+            start = max(self._updated, self._paused_until)
+            self.tokens = min(self.burst, self.tokens + (now - start) * self.rate)
+        self._updated = now
+
+    def _order(self):
+        """Queued tickets in the order they will be served"""
+        for lane in sorted(self._queues, key=LANES.get):
+            sessions = [list(queue) for queue in self._queues[lane].values()]
+            # Round-robin: every session's first ticket, then every second one...
+            for depth in range(max((len(q) for q in sessions), default=0)):
+                for queue in sessions:
+                    if depth < len(queue):
+                        yield queue[depth]
+
+    def _seconds_until(self, needed_tokens):
+        pause = max(0.0, self._paused_until - time.monotonic())
+        missing = max(0.0, needed_tokens - self.tokens)
+        return pause + missing / self.rate
+
+    def _enqueue(self, ticket):
+        sessions = self._queues[ticket.lane]
+        sessions.setdefault(ticket.session, deque()).append(ticket)
+
+    def _dequeue(self, ticket):
+        sessions = self._queues[ticket.lane]
+        queue = sessions[ticket.session]
+        queue.remove(ticket)
+        # The session goes to the back of its lane, the next session is up
+        del sessions[ticket.session]
+        if queue:
+            sessions[ticket.session] = queue
+
+    def _estimate(self, lane):
+        ahead = sum(1 for ticket in self._order() if LANES[ticket.lane] <= LANES[lane])
+        return self._seconds_until(ahead + 1)
+
+    def estimate_wait(self, lane="interactive"):
+        """Seconds a request entering `lane` now would wait for its token"""
+        if self.unlimited:
+            return 0.0
+        with self._condition:
+            self._refill()
+            return self._estimate(lane)
+
+    def acquire(self, session=None, lane=None, max_wait=None, on_wait=None):
+        """Block until this caller may send one request, return the seconds waited"""
+        if self.unlimited:
+            return 0.0
+        lane = lane or current_lane.get()
+        lane = lane if lane in LANES else "interactive"
+        session = session if session is not None else current_session.get()
+        if max_wait is None and lane == "interactive":
+            max_wait = self.max_wait
+        if on_wait is None:
+            registered = current_wait_callback.get()
+            if registered is not None and registered[0] == threading.get_ident():
+                on_wait = registered[1]
+
+        ticket = _Ticket(session, lane)
+        started = time.monotonic()
+        last_reported = None
+        with self._condition:
+            self._enqueue(ticket)
+            try:
+                while True:
+                    self._refill()
+                    position = next(i for i, t in enumerate(self._order()) if t is ticket)
+                    if position == 0 and self.tokens >= 1 and time.monotonic() >= self._paused_until:
+                        self.tokens -= 1
+                        break
+
+                    estimate = self._seconds_until(position + 1)
+                    if max_wait is not None and time.monotonic() - started + estimate > max_wait:
+                        raise RateLimitTimeout(self.name, estimate)
+                    if on_wait is not None and (position, round(estimate)) != last_reported:
+                        last_reported = (position, round(estimate))
+                        self._condition.release()
+                        try:
+                            on_wait(position, estimate)
+                        finally:
+                            self._condition.acquire()
+                        continue
+                    # Woken early whenever someone else takes a token or leaves the line
+                    self._condition.wait(min(max(estimate, 0.01), 1.0))
+            finally:
+                # Leaving the line for any reason (granted, timed out, or an exception from
+                # on_wait such as a Streamlit rerun) must not leave the ticket blocking it
+                self._dequeue(ticket)
+                self._condition.notify_all()
+
+            waited = time.monotonic() - started
+            self.granted += 1
+            self.total_wait += waited
+        return waited
+
+    def report_rate_limited(self, retry_after=None):
+        """The service answered 429: stop handing out tokens for a while"""
+        with self._condition:
+            pause = retry_after if retry_after else max(1.0, 1.0 / self.rate if self.rate else 1.0)
+            self._paused_until = max(self._paused_until, time.monotonic() + pause)
+            self.tokens = 0.0
+            self.throttled += 1
+            self._condition.notify_all()
+
+    def snapshot(self):
+        with self._condition:
+            self._refill()
+            return {
+                "rpm": self.rate * 60,
+                "tokens": self.tokens,
+                "queued": {lane: sum(len(q) for q in sessions.values())
+                           for lane, sessions in self._queues.items()},
+                "granted": self.granted,
+                "throttled": self.throttled,
+                "avg_wait_ms": 1000 * self.total_wait / self.granted if self.granted else 0.0,
+                "estimated_wait": {lane: 0.0 if self.unlimited else self._estimate(lane)
+                                   for lane in LANES},
+            }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(service):
+    """Process-wide limiter for an external service, configured from settings on first use"""
+    with _limiters_lock:
+        limiter = _limiters.get(service)
+        if limiter is None:
+            defaults = SERVICE_LIMITS.get(service, {"rpm": 0, "burst": 5})
+            prefix = service.upper()
+            limiter = FairRateLimiter(
+                service,
+                requests_per_minute=get_float_setting(f"{prefix}_RPM", defaults["rpm"]),
+                burst=get_int_setting(f"{prefix}_BURST", defaults["burst"]),
+                max_wait=get_float_setting("RATE_LIMIT_MAX_WAIT", 120.0),
+            )
+            _limiters[service] = limiter
+        return limiter
+
+
+def rate_limit_metrics():
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {name: limiter.snapshot() for name, limiter in limiters.items()}
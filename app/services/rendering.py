@@ -0,0 +1,24 @@
+from app.services.pdf_export import render_pdf
+from app.utils.templates import photo_html, photo_key, render_persona_document
+
+# Entry points for process pools (the HTTP API, bulk rendering): plain dicts and
+# bytes in, str or bytes out, so arguments and results pickle cheaply
+
+
+def preview_html(template, persona_data, photo=None):
+    """Standalone HTML page of the card, with the 150px preview thumbnail"""
+    return render_persona_document(template, persona_data, photo_html(photo, 150, "WEBP"),
+                                   image_key=photo_key(photo, 150, "WEBP"))
+
+
+def pdf_document(template, persona_data, photo=None):
+    """The HTML a PDF export is rendered from, with the 100px thumbnail"""
+    return render_persona_document(template, persona_data, photo_html(photo, 100),
+                                   image_key=photo_key(photo, 100))
+
+
+def persona_pdf(template, persona_data, photo=None):
+    """PDF export of the card, same output as the builder's "Download PDF" """
+    html_content = pdf_document(template, persona_data, photo)
+    # Backends that draw the card themselves (fpdf) also need the template and photo
+    return render_pdf(html_content, dict(persona_data, user_photo=photo, selected_template=template))
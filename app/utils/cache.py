@@ -0,0 +1,215 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+def content_digest(*parts):
+    """Stable sha256 hex digest over a sequence of str/bytes parts"""
+    digest = hashlib.sha256()
+    for part in parts:
+        if part is None:
+            part = b""
+        elif isinstance(part, str):
+            part = part.encode("utf-8")
+        elif not isinstance(part, (bytes, bytearray)):
+            part = str(part).encode("utf-8")
+        # Length prefix so ("ab", "c") and ("a", "bc") never collide
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+class BlobCache:
+    """Content-addressed bytes cache: in-memory LRU in front of an optional on-disk store.
+
+    With a ttl (seconds) entries older than that are treated as misses and dropped.
+    On disk the file mtime records when an entry was written and the atime when it
+    was last read, which drives LRU eviction.
+    """
+
+    def __init__(self, name, max_items=64, max_memory_bytes=64 * 1024 * 1024,
+                 disk_dir=None, max_disk_bytes=256 * 1024 * 1024, ttl=None):
+        self.name = name
+        self.ttl = ttl
+        self.max_items = max_items
+        self.max_memory_bytes = max_memory_bytes
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.expired = 0
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._disk_entries())
+
+    def get(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, stored_at = entry
+                if not self._is_expired(stored_at):
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._memory.pop(key)
+                self._memory_bytes -= len(value)
+                self.expired += 1
+
+        value, stored_at = self._disk_read(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._memory_put(key, value, stored_at)
+        return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._memory_put(key, value, time.time())
+        self._disk_write(key, value)
+
+    def delete(self, key):
+        with self._lock:
+            entry = self._memory.pop(key, None)
+            if entry is not None:
+                self._memory_bytes -= len(entry[0])
+        if self.disk_dir:
+            path = self._disk_path(key)
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+            except OSError:
+                return
+            with self._lock:
+                self._disk_bytes -= size
+
+    def get_or_create(self, key, factory):
+        value = self.get(key)
+        if value is None:
+            value = factory()
+            if value is not None:
+                self.put(key, value)
+        return value
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "name": self.name,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_items": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_bytes": self._disk_bytes,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            for path, _, _ in self._disk_entries():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._disk_bytes = 0
+
+    def _is_expired(self, stored_at):
+        return self.ttl is not None and time.time() - stored_at > self.ttl
+
+    # Memory tier (caller holds the lock)
+    def _memory_put(self, key, value, stored_at):
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= len(previous[0])
+        self._memory[key] = (value, stored_at)
+        self._memory_bytes += len(value)
+        while self._memory and (len(self._memory) > self.max_items
+                                or self._memory_bytes > self.max_memory_bytes):
+            _, (evicted, _) = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    # Disk tier
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.bin")
+
+    def _disk_entries(self):
+        # Memory-only caches have no files, and scandir(None) would list the working directory
+        if not self.disk_dir:
+            return []
+        entries = []
+        try:
+            with os.scandir(self.disk_dir) as it:
+                for entry in it:
+                    if entry.is_file() and entry.name.endswith(".bin"):
+                        stat = entry.stat()
+                        entries.append((entry.path, stat.st_size, stat.st_atime))
+        except OSError:
+            pass
+        return entries
+
+    def _disk_read(self, key):
+        if not self.disk_dir:
+            return None, None
+        path = self._disk_path(key)
+        try:
+            stored_at = os.path.getmtime(path)
+            if self._is_expired(stored_at):
+                size = os.path.getsize(path)
+                os.remove(path)
+                with self._lock:
+                    self._disk_bytes -= size
+                    self.expired += 1
+                return None, None
+            with open(path, "rb") as f:
+                value = f.read()
+            # Record the access in atime, mtime keeps the write time for the TTL
+            os.utime(path, (time.time(), stored_at))
+            return value, stored_at
+        except OSError:
+            return None, None
+
+    def _disk_write(self, key, value):
+        if not self.disk_dir or len(value) > self.max_disk_bytes:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            existing = os.path.getsize(path) if os.path.exists(path) else 0
+            with open(tmp_path, "wb") as f:
+                f.write(value)
+            os.replace(tmp_path, path)
+        except OSError:
+            return
+        with self._lock:
+            self._disk_bytes += len(value) - existing
+            if self._disk_bytes > self.max_disk_bytes:
+                self._evict_disk()
+
+    def _evict_disk(self):
+        # Drop expired files, then least recently used ones until we are back under 90% of the cap
+        target = int(self.max_disk_bytes * 0.9)
+        entries = sorted(self._disk_entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            try:
+                if total > target or self._is_expired(os.path.getmtime(path)):
+                    os.remove(path)
+                    total -= size
+            except OSError:
+                pass
+        self._disk_bytes = total
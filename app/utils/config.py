@@ -0,0 +1,34 @@
+import os
+
+
+# Read a setting from Streamlit secrets first, then from the environment
+def get_setting(name, default=None):
+    try:
+        import streamlit as st
+        if name in st.secrets:
+            return st.secrets[name]
+    except Exception:
+        # No secrets.toml (or no Streamlit at all, e.g. CLI / API usage)
+        pass
+    return os.environ.get(name, default)
+
+
+def get_int_setting(name, default):
+    try:
+        return int(get_setting(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def get_float_setting(name, default):
+    try:
+        return float(get_setting(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def get_bool_setting(name, default=False):
+    value = get_setting(name, default)
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return bool(value)
@@ -0,0 +1,140 @@
+import hashlib
+import random
+import re
+import zlib
+from array import array
+
+from app.utils.config import get_float_setting
+
+# The free-text fields Gemini tends to repeat almost verbatim. Names, ages and
+# locations vary even between copies, so they are left out
+DEDUP_FIELDS = ("goals", "frustrations", "motivations", "needs", "skills", "pain_points")
+
+# Stored signatures depend on these, changing them invalidates a persona library's index
+NUM_PERM = 64
+BANDS = 16
+SHINGLE_SIZE = 5
+
+_PRIME = (1 << 61) - 1
+_WORDS = re.compile(r"[a-z0-9]+")
+
+
+def shingles(text, k=SHINGLE_SIZE):
+    """Stable 32-bit hashes of the character k-grams of the normalized text.
+
+    Character shingles (not word ones) keep short fields like "Improve accessibility
+    in tech products" comparable after a one-word edit.
+    """
+    text = " ".join(_WORDS.findall(text.lower()))
+    if len(text) <= k:
+        return {zlib.crc32(text.encode("utf-8"))} if text else set()
+    return {zlib.crc32(text[i:i + k].encode("utf-8")) for i in range(len(text) - k + 1)}
+
+
+def persona_text(persona, fields=DEDUP_FIELDS):
+    # Works for Persona objects and plain dicts alike
+    return " | ".join(str(persona.get(field) or "") for field in fields)
+
+
+class MinHasher:
+    """MinHash signatures: the Jaccard similarity of two shingle sets is estimated
+    by the fraction of positions where their signatures agree"""
+
+    def __init__(self, num_perm=NUM_PERM, seed=1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self._permutations = [(rng.randrange(1, _PRIME), rng.randrange(0, _PRIME))
+                              for _ in range(num_perm)]
+
+    def signature(self, hashes):
+        """Signature tuple for a set of shingle hashes, None for an empty set"""
+        if not hashes:
+            return None
+        return tuple(min([(a * x + b) % _PRIME for x in hashes]) for a, b in self._permutations)
+
+
+_hasher = MinHasher()
+
+
+def persona_signature(persona):
+    """MinHash signature of a persona's free text, None when it has none"""
+    return _hasher.signature(shingles(persona_text(persona)))
+
+
+def similarity(signature, other):
+    return sum(1 for a, b in zip(signature, other) if a == b) / len(signature)
+
+
+def band_keys(signature, bands=BANDS):
+    """(band, bucket) pairs. Two signatures sharing any pair are duplicate candidates.
+
+    With 16 bands of 4 rows, pairs at 0.7 similarity collide in some band ~99% of
+    the time and pairs at 0.3 only ~12%, so a lookup touches few candidates.
+    """
+    rows = len(signature) // bands
+    for band in range(bands):
+        chunk = array("Q", signature[band * rows:(band + 1) * rows]).tobytes()
+        # Signed 64 bits so it fits an SQLite INTEGER
+        yield band, int.from_bytes(hashlib.blake2b(chunk, digest_size=8).digest(), "big", signed=True)
+
+
+def pack_signature(signature):
+    return array("Q", signature).tobytes()
+
+
+def unpack_signature(data):
+    return tuple(array("Q", data))
+
+
+def dedup_threshold():
+    return get_float_setting("DEDUP_THRESHOLD", 0.7)
+
+
+class LSHIndex:
+    """In-memory near-duplicate index over MinHash signatures.
+
+    Lookups only compare against keys sharing an LSH bucket, so the cost stays
+    flat as the index grows instead of one comparison per stored item.
+    """
+
+    def __init__(self, threshold=None, bands=BANDS):
+        self.threshold = dedup_threshold() if threshold is None else threshold
+        self.bands = bands
+        self._buckets = {}
+        self._signatures = {}
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def add(self, key, signature):
+        if signature is None:
+            return
+        self.remove(key)
+        self._signatures[key] = signature
+        for band_key in band_keys(signature, self.bands):
+            self._buckets.setdefault(band_key, set()).add(key)
+
+    def remove(self, key):
+        signature = self._signatures.pop(key, None)
+        if signature is None:
+            return
+        for band_key in band_keys(signature, self.bands):
+            bucket = self._buckets.get(band_key)
+            bucket.discard(key)
+            if not bucket:
+                del self._buckets[band_key]
+
+    def query(self, signature):
+        """[(key, similarity)] of stored items at or above the threshold, most similar first"""
+        if signature is None:
+            return []
+        candidates = set()
+        for band_key in band_keys(signature, self.bands):
+            candidates.update(self._buckets.get(band_key, ()))
+        matches = [(key, similarity(signature, self._signatures[key])) for key in candidates]
+        return sorted((match for match in matches if match[1] >= self.threshold),
+                      key=lambda match: match[1], reverse=True)
+
+    def find_duplicate(self, signature):
+        matches = self.query(signature)
+        return matches[0] if matches else None
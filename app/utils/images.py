@@ -0,0 +1,165 @@
+import base64
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+from app.utils.cache import BlobCache, content_digest
+from app.utils.config import get_int_setting
+
+MIME_TYPES = {
+    "PNG": "image/png",
+    "JPEG": "image/jpeg",
+    "WEBP": "image/webp",
+    "GIF": "image/gif",
+}
+
+# Formats every consumer (browser, wkhtmltopdf, fpdf2) can use as they are
+PASSTHROUGH_FORMATS = {"PNG", "JPEG"}
+
+_data_uri_cache = OrderedDict()
+_source_digests = OrderedDict()
+_DATA_URI_CACHE_SIZE = get_int_setting("DATA_URI_CACHE_MAX_ITEMS", 64)
+_data_uri_lock = threading.Lock()
+_data_uri_stats = {"hits": 0, "misses": 0, "bytes_encoded": 0, "bytes_avoided": 0}
+
+# Derived thumbnails, keyed by source digest, size and format
+thumbnail_cache = BlobCache(
+    "thumbnail",
+    max_items=get_int_setting("THUMBNAIL_CACHE_MAX_ITEMS", 256),
+    max_memory_bytes=16 * 1024 * 1024,
+)
+
+
+def sniff_format(data):
+    """Image format from the magic bytes, without decoding anything"""
+    if not data:
+        return None
+    head = bytes(data[:12])
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "PNG"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "JPEG"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "WEBP"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "GIF"
+    return None
+
+
+def image_mime(data):
+    return MIME_TYPES.get(sniff_format(data), "image/png")
+
+
+def image_extension(data):
+    """File extension for the image's actual format (".jpg" for passthrough JPEGs)"""
+    subtype = image_mime(data).split("/", 1)[1]
+    return ".jpg" if subtype == "jpeg" else f".{subtype}"
+
+
+def normalize_image(data, size=None):
+    """Bytes safe to store on the persona, decoded and re-encoded only when needed.
+
+    PNG/JPEG sources are passed through untouched unless a resize to `size`
+    (square, LANCZOS) is requested; anything else is converted to PNG once.
+    """
+    image_format = sniff_format(data)
+    if size is None and image_format in PASSTHROUGH_FORMATS:
+        return bytes(data)
+
+    from PIL import Image
+
+    image = Image.open(BytesIO(data))
+    if size is not None and image.size != (size, size):
+        image = image.resize((size, size), Image.LANCZOS)
+    buffer = BytesIO()
+    if image_format == "JPEG":
+        image.save(buffer, format="JPEG", quality=90)
+    else:
+        image.save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
+
+
+def _make_thumbnail(data, size, image_format):
+    from PIL import Image, ImageOps
+
+    image = Image.open(BytesIO(data))
+    # JPEG sources can be decoded at a reduced scale straight away
+    image.draft("RGB", (size, size))
+    image = ImageOps.fit(image, (size, size), Image.LANCZOS)
+
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+    if image_format == "JPEG" and image.mode == "RGBA":
+        # JPEG has no alpha channel, flatten onto the white card background
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+
+    buffer = BytesIO()
+    if image_format == "WEBP":
+        image.save(buffer, format="WEBP", quality=get_int_setting("THUMBNAIL_QUALITY", 85), method=4)
+    else:
+        image.save(buffer, format="JPEG", quality=get_int_setting("THUMBNAIL_QUALITY", 85), optimize=True)
+    return buffer.getvalue()
+
+
+def source_digest(data):
+    """Digest of an image, remembered per bytes object so reruns do not rehash it"""
+    with _data_uri_lock:
+        entry = _source_digests.get(id(data))
+        # The entry holds a reference to `data`, so its id cannot be reused while cached
+        if entry is not None and entry[0] is data:
+            return entry[1]
+    digest = content_digest(data)
+    with _data_uri_lock:
+        _source_digests[id(data)] = (data, digest)
+        if len(_source_digests) > _DATA_URI_CACHE_SIZE:
+            _source_digests.popitem(last=False)
+    return digest
+
+
+def thumbnail(data, size, image_format="JPEG"):
+    """Square `size` px derivative of an image, memoized by the source digest.
+
+    Defaults to JPEG, which every renderer understands; wkhtmltopdf's WebKit
+    cannot show WebP so only pass "WEBP" for browser output.
+    """
+    if not data:
+        return None
+    image_format = image_format.upper()
+    key = content_digest(source_digest(data), size, image_format)
+    return thumbnail_cache.get_or_create(key, lambda: _make_thumbnail(data, size, image_format))
+
+
+def thumbnail_cache_stats():
+    return thumbnail_cache.stats()
+
+
+def photo_data_uri(data, size, image_format="JPEG"):
+    """data: URI of the `size` px thumbnail, built once per (photo digest, size, format)"""
+    if not data:
+        return ""
+    key = (source_digest(data), size, image_format.upper())
+    with _data_uri_lock:
+        uri = _data_uri_cache.get(key)
+        if uri is not None:
+            _data_uri_cache.move_to_end(key)
+            _data_uri_stats["hits"] += 1
+            _data_uri_stats["bytes_avoided"] += len(uri)
+            return uri
+
+    thumb = thumbnail(data, size, image_format)
+    uri = f"data:{image_mime(thumb)};base64,{base64.b64encode(thumb).decode('ascii')}"
+    with _data_uri_lock:
+        _data_uri_stats["misses"] += 1
+        _data_uri_stats["bytes_encoded"] += len(uri)
+        _data_uri_cache[key] = uri
+        if len(_data_uri_cache) > _DATA_URI_CACHE_SIZE:
+            _data_uri_cache.popitem(last=False)
+    return uri
+
+
+def data_uri_stats():
+    """Hits/misses plus bytes of base64 produced vs. skipped thanks to the cache"""
+    with _data_uri_lock:
+        return dict(_data_uri_stats, items=len(_data_uri_cache))
@@ -0,0 +1,98 @@
+import json
+
+
+class JsonStreamParser:
+    """Incremental scanner for a JSON document arriving in chunks (e.g. a streamed LLM reply).
+
+    feed() returns the top-level members completed so far: (key, value) pairs for an
+    object, (index, value) pairs for an array. Text before the first bracket and after
+    the closing one (markdown fences, chatter) is ignored.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.done = False
+        self._pos = 0
+        self._kind = None  # "{" or "[" once the document has started
+        self._start = None
+        self._end = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._key_start = None
+        self._key = None
+        self._value_start = None
+        self._index = 0
+
+    def feed(self, chunk):
+        self.text += chunk
+        text = self.text
+        events = []
+        i = self._pos
+        while i < len(text) and not self.done:
+            c = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._key_start is not None and self._key is None:
+                        try:
+                            self._key = json.loads(text[self._key_start:i + 1])
+                        except ValueError:
+                            self._key = text[self._key_start + 1:i]
+            elif self._kind is None:
+                if c in "{[":
+                    self._kind = c
+                    self._start = i
+                    self._depth = 1
+            elif c == '"':
+                self._in_string = True
+                if self._depth == 1:
+                    if self._kind == "{" and self._key is None:
+                        self._key_start = i
+                    elif self._value_start is None:
+                        self._value_start = i
+            elif c in "{[":
+                if self._depth == 1 and self._value_start is None:
+                    self._value_start = i
+                self._depth += 1
+            elif c in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._finish_member(i, events)
+                    self._end = i
+                    self.done = True
+            elif self._depth == 1:
+                if c == ",":
+                    self._finish_member(i, events)
+                elif c != ":" and not c.isspace() and self._value_start is None \
+                        and (self._kind == "[" or self._key is not None):
+                    self._value_start = i  # Number, true/false/null
+            i += 1
+        self._pos = i
+        return events
+
+    def _finish_member(self, end, events):
+        if self._value_start is not None:
+            try:
+                value = json.loads(self.text[self._value_start:end].strip())
+            except ValueError:
+                value = None
+            else:
+                if self._kind == "{":
+                    events.append((self._key, value))
+                else:
+                    events.append((self._index, value))
+                    self._index += 1
+        self._key_start = None
+        self._key = None
+        self._value_start = None
+
+    def document(self):
+        """The whole parsed document (raises ValueError if it is incomplete or invalid)"""
+        if not self.done:
+            raise ValueError("JSON document is incomplete")
+        return json.loads(self.text[self._start:self._end + 1])
@@ -1,229 +1,349 @@
+import html
+import re
+import threading
+from collections import OrderedDict
+
+from app.utils.cache import content_digest
+from app.utils.images import photo_data_uri, source_digest
+
+# Template sources use {{ field }} placeholders, values are HTML-escaped unless
+# a filter says otherwise:
+#   {{ field|join }}   comma separated list ("None" when empty)
+#   {{ field|stars }}  one ⭐ per level
+#   {{ field|raw }}    inserted as-is (only for markup we build ourselves)
+
 BASIC_TEMPLATE = """
-                <html>
-                <head>
-                    <style>
-                        body {{ font-family: sans-serif; }}
-                        .persona-card-basic {{ border: 1px solid #ddd; padding: 20px; border-radius: 5px; background-color: #f9f9f9; }}
-                        .persona-header {{ text-align: center; margin-bottom: 15px; }}
-                        .persona-header h2 {{ margin-bottom: 5px; color: #333; }}
-                        .persona-header .subtitle {{ color: #777; font-size: 0.9em; }}
-                        .persona-section {{ margin-bottom: 15px; padding-bottom: 10px; border-bottom: 1px solid #eee; }}
-                        .persona-section:last-child {{ border-bottom: none; }}
-                        .persona-section h3 {{ color: #555; margin-top: 0; margin-bottom: 10px; }}
-                        .persona-section p {{ margin-bottom: 5px; color: #444; }}
-                        .persona-section p strong {{ font-weight: bold; color: #333; margin-right: 5px; }}
-                        .user-photo {{ text-align: center; margin-bottom: 10px; }}
-                        .user-photo img {{ width: 100px; height: auto; border-radius: 50%; object-fit: cover; }}
-                    </style>
-                </head>
-                <body>
-                    <div class="persona-card-basic">
-                        <div class="user-photo">{image_html}</div>
-                        <div class="persona-header">
-                            <h2>{name}</h2>
-                            <p class="subtitle">{occupation} • {location} • {age} years</p>
-                        </div>
-                        <div class="persona-section">
-                            <h3>📌 Basic Information</h3>
-                            <p><strong>Gender:</strong> {gender}</p>
-                            <p><strong>Tech Savviness:</strong>'⭐' {tech_savviness}</p>
-                        </div>
-                        <div class="persona-section">
-                            <h3>🎯 Goals & Motivations</h3>
-                            <p><strong>Goals:</strong> {goals}</p>
-                            <p><strong>Motivations:</strong> {motivations}</p>
-                        </div>
-                        <div class="persona-section">
-                            <h3>⚠️ Pain Points</h3>
-                            <p><strong>Frustrations:</strong> {frustrations}</p>
-                            <p><strong>Challenges:</strong> {pain_points}</p>
-                        </div>
-                        <div class="persona-section">
-                            <h3>🛠 Skills & Needs</h3>
-                            <p><strong>Skills:</strong> {skills}</p>
-                            <p><strong>Needs:</strong> {needs}</p>
-                        </div>
-                        <div class="persona-section">
-                            <h3>🌐 Preferences</h3>
-                            <p><strong>Interests:</strong> {', '.join({interests} or [])}</p>
-                            <p><strong>Platforms:</strong> {', '.join(persona_data.get('platforms', []) or [])}</p>
-                        </div>
-                    </div>
-                </body>
-                </html>
-                """.strip()
+<div class="persona-card-basic">
+    <div class="user-photo" style="text-align: center;">{{ image_html|raw }}</div>
+    <div class="persona-header">
+        <h2>{{ name }}</h2>
+        <p class="subtitle">{{ occupation }} • {{ location }} • {{ age }} years</p>
+    </div>
+    <div class="persona-section">
+        <h3>📌 Basic Information</h3>
+        <p><strong>Gender:</strong> {{ gender }}</p>
+        <p><strong>Tech Savviness:</strong> {{ tech_savviness|stars }}</p>
+    </div>
+    <div class="persona-section">
+        <h3>🎯 Goals & Motivations</h3>
+        <p><strong>Goals:</strong> {{ goals }}</p>
+        <p><strong>Motivations:</strong> {{ motivations }}</p>
+    </div>
+    <div class="persona-section">
+        <h3>⚠️ Pain Points</h3>
+        <p><strong>Frustrations:</strong> {{ frustrations }}</p>
+        <p><strong>Challenges:</strong> {{ pain_points }}</p>
+    </div>
+    <div class="persona-section">
+        <h3>🛠 Skills & Needs</h3>
+        <p><strong>Skills:</strong> {{ skills }}</p>
+        <p><strong>Needs:</strong> {{ needs }}</p>
+    </div>
+    <div class="persona-section">
+        <h3>🌐 Preferences</h3>
+        <p><strong>Interests:</strong> {{ interests|join }}</p>
+        <p><strong>Platforms:</strong> {{ platforms|join }}</p>
+    </div>
+</div>
+""".strip()
 
 MODERN_TEMPLATE = """
-                <html>
-                <head>
-                    <style>
-                        body {{ font-family: sans-serif; }}
-                        .persona-card-modern-stacked {{ background-color: #fff; border-radius: 8px; box-shadow: 0 2px 10px rgba(0, 0, 0, 0.1); padding: 25px; }}
-                        .user-photo-modern-stacked img {{ width: 100px; height: 100px; border-radius: 50%; object-fit: cover; margin: 0 auto 15px auto; display: block; }}
-                        .modern-header {{ text-align: center; margin-bottom: 20px; }}
-                        .modern-header h2 {{ color: #2c3e50; margin-bottom: 8px; }}
-                        .modern-header .subtitle {{ color: #777; font-size: 0.9em; margin-bottom: 5px; }}
-                        .modern-header .tech-savvy {{ color: #3498db; font-size: 0.95em; }}
-                        .modern-section {{ margin-bottom: 18px; padding-bottom: 12px; border-bottom: 1px solid #eee; }}
-                        .modern-section:last-child {{ border-bottom: none; }}
-                        .modern-section h3 {{ color: #2c3e50; margin-top: 0; margin-bottom: 10px; font-size: 1.15em; }}
-                        .modern-section p {{ color: #555; margin-bottom: 0; font-size: 0.95em; line-height: 1.6; }}
-                    </style>
-                </head>
-                <body>
-                    <div class="persona-card-modern-stacked">
-                        <div class="user-photo-modern-stacked">{image_html}</div>
-                        <div class="modern-header">
-                            <h2>{persona_data.get('name', '')}</h2>
-                            <p class="subtitle">{persona_data.get('occupation', '')} • {persona_data.get('location', '')} • {persona_data.get('age', '')} years</p>
-                            <div class="tech-savvy"><strong>Tech Savviness:</strong> {'⭐' * persona_data.get('tech_savviness', 0)}</div>
-                        </div>
-                        <div class="modern-section">
-                            <h3>🎯 Goals</h3>
-                            <p>{persona_data.get('goals', '')}</p>
-                        </div>
-                        <div class="modern-section">
-                            <h3>💡 Motivations</h3>
-                            <p>{persona_data.get('motivations', '')}</p>
-                        </div>
-                        <div class="modern-section">
-                            <h3>⚠️ Frustrations</h3>
-                            <p>{persona_data.get('frustrations', '')}</p>
-                        </div>
-                        <div class="modern-section">
-                            <h3>💔 Pain Points</h3>
-                            <p>{persona_data.get('pain_points', '')}</p>
-                        </div>
-                        <div class="modern-section">
-                            <h3>🛠 Skills</h3>
-                            <p>{persona_data.get('skills', '')}</p>
-                        </div>
-                        <div class="modern-section">
-                            <h3>🌐 Interests</h3>
-                            <p>{', '.join(persona_data.get('interests', []) or [])}</p>
-                        </div>
-                        <div class="modern-section">
-                            <h3>📱 Platforms</h3>
-                            <p>{', '.join(persona_data.get('platforms', []) or [])}</p>
-                        </div>
-                        <div class="modern-section">
-                            <h3>👤 Gender</h3>
-                            <p>{persona_data.get('gender', '')}</p>
-                        </div>
-                    </div>
-                </body>
-                </html>
-                """.strip()
+<div class="persona-card-modern-stacked">
+    <div class="user-photo-modern-stacked" style="text-align: center;">{{ image_html|raw }}</div>
+    <div class="modern-header">
+        <h2>{{ name }}</h2>
+        <p class="subtitle">{{ occupation }} • {{ location }} • {{ age }} years</p>
+        <div class="tech-savvy"><strong>Tech Savviness:</strong> {{ tech_savviness|stars }}</div>
+    </div>
+    <div class="modern-section">
+        <h3>🎯 Goals</h3>
+        <p>{{ goals }}</p>
+    </div>
+    <div class="modern-section">
+        <h3>💡 Motivations</h3>
+        <p>{{ motivations }}</p>
+    </div>
+    <div class="modern-section">
+        <h3>⚠️ Frustrations</h3>
+        <p>{{ frustrations }}</p>
+    </div>
+    <div class="modern-section">
+        <h3>💔 Pain Points</h3>
+        <p>{{ pain_points }}</p>
+    </div>
+    <div class="modern-section">
+        <h3>🛠 Skills</h3>
+        <p>{{ skills }}</p>
+    </div>
+    <div class="modern-section">
+        <h3>🌐 Interests</h3>
+        <p>{{ interests|join }}</p>
+    </div>
+    <div class="modern-section">
+        <h3>📱 Platforms</h3>
+        <p>{{ platforms|join }}</p>
+    </div>
+    <div class="modern-section">
+        <h3>👤 Gender</h3>
+        <p>{{ gender }}</p>
+    </div>
+</div>
+""".strip()
 
 PROFESSIONAL_TEMPLATE = """
-                <html>
-                <head>
-                    <style>
-                        body {{ font-family: sans-serif; }}
-                        .persona-card-professional {{ border: 1px solid #aaa; padding: 20px; border-radius: 3px; background-color: #f0f0f0; }}
-                        .professional-header {{ text-align: center; margin-bottom: 20px; }}
-                        .user-photo-professional img {{ width: 100px; height: 100px; border-radius: 50%; object-fit: cover; margin-bottom: 15px; }}
-                        .professional-header h2 {{ color: #222; margin-bottom: 5px; }}
-                        .professional-header .title {{ color: #555; font-size: 1em; margin-bottom: 3px; }}
-                        .professional-header .location {{ color: #777; font-size: 0.9em; }}
-                        .professional-section {{ margin-bottom: 18px; padding-bottom: 12px; border-bottom: 1px solid #ccc; }}
-                        .professional-section:last-child {{ border-bottom: none; }}
-                        .professional-section h3 {{ color: #333; margin-top: 0; margin-bottom: 10px; font-size: 1.2em; border-bottom: 2px solid #555; padding-bottom: 5px; display: flex; align-items: center; gap: 8px; }}
-                        .professional-section p {{ margin-bottom: 8px; color: #444; line-height: 1.5; display: flex; align-items: center; gap: 8px; }}
-                        .professional-section p strong {{ font-weight: bold; color: #222; margin-right: 5px; }}
-                    </style>
-                </head>
-                <body>
-                    <div class="persona-card-professional">
-                        <div class="professional-header">
-                            <div class="user-photo-professional">{image_html}</div>
-                            <h2>{persona_data.get('name', '')}</h2>
-                            <p class="title">{persona_data.get('occupation', '')}</p>
-                            <p class="location">📍 {persona_data.get('location', '')} | 🗓️ Age: {persona_data.get('age', '')}</p>
-                        </div>
-                        <div class="professional-section">
-                            <h3>👤 About</h3>
-                            <p><strong>Gender:</strong> {persona_data.get('gender', '')}</p>
-                            <p><strong>💻 Tech Savviness:</strong> Level {persona_data.get('tech_savviness', 0)}</p>
-                        </div>
-                        <div class="professional-section">
-                            <h3>💼 Professional Profile</h3>
-                            <p><strong>🎯 Goals:</strong> {persona_data.get('goals', '')}</p>
-                            <p><strong>🚀 Motivations:</strong> {persona_data.get('motivations', '')}</p>
-                            <p><strong> skills:</strong> {persona_data.get('skills', '')}</p>
-                        </div>
-                        <div class="professional-section">
-                            <h3>⚠️ Challenges & Needs</h3>
-                            <p><strong>😠 Frustrations:</strong> {persona_data.get('frustrations', '')}</p>
-                            <p><strong>💔 Pain Points:</strong> {persona_data.get('pain_points', '')}</p>
-                            <p><strong>✅ Needs:</strong> {persona_data.get('needs', '')}</p>
-                        </div>
-                        <div class="professional-section">
-                            <h3>🌐 Preferences</h3>
-                            <p><strong>❤️ Interests:</strong> {', '.join(persona_data.get('interests', []) or [])}</p>
-                            <p><strong>📱 Platforms:</strong> {', '.join(persona_data.get('platforms', []) or [])}</p>
-                        </div>
-                    </div>
-                </body>
-                </html>
-                """.strip()
+<div class="persona-card-professional">
+    <div class="professional-header">
+        <div class="user-photo-professional" style="text-align: center;">{{ image_html|raw }}</div>
+        <h2>{{ name }}</h2>
+        <p class="title">{{ occupation }}</p>
+        <p class="location">📍 {{ location }} | 🗓️ Age: {{ age }}</p>
+    </div>
+    <div class="professional-section">
+        <h3>👤 About</h3>
+        <p><strong>Gender:</strong> {{ gender }}</p>
+        <p><strong>💻 Tech Savviness:</strong> Level {{ tech_savviness }}</p>
+    </div>
+    <div class="professional-section">
+        <h3>💼 Professional Profile</h3>
+        <p><strong>🎯 Goals:</strong> {{ goals }}</p>
+        <p><strong>🚀 Motivations:</strong> {{ motivations }}</p>
+        <p><strong>🛠 Skills:</strong> {{ skills }}</p>
+    </div>
+    <div class="professional-section">
+        <h3>⚠️ Challenges & Needs</h3>
+        <p><strong>😠 Frustrations:</strong> {{ frustrations }}</p>
+        <p><strong>💔 Pain Points:</strong> {{ pain_points }}</p>
+        <p><strong>✅ Needs:</strong> {{ needs }}</p>
+    </div>
+    <div class="professional-section">
+        <h3>🌐 Preferences</h3>
+        <p><strong>❤️ Interests:</strong> {{ interests|join }}</p>
+        <p><strong>📱 Platforms:</strong> {{ platforms|join }}</p>
+    </div>
+</div>
+""".strip()
 
 CREATIVE_TEMPLATE = """
-                <html>
-                <head>
-                    <style>
-                        body {{ font-family: sans-serif; }}
-                        .persona-card-creative {{ background-color: #e0f7fa; padding: 25px; border-radius: 10px; box-shadow: 0 4px 15px rgba(0, 0, 0, 0.08); border: 2px solid #b2ebf2; }}
-                        .creative-header {{ text-align: center; margin-bottom: 25px; }}
-                        .user-photo-creative img {{ width: 100px; height: 100px; border-radius: 50%; object-fit: cover; margin-bottom: 15px; }}
-                        .creative-header h1 {{ color: #00838f; margin-bottom: 5px; font-size: 2.5em; }}
-                        .creative-header .tagline {{ color: #26a69a; font-size: 1.1em; }}
-                        .creative-section {{ margin-bottom: 20px; padding-bottom: 15px; border-bottom: 2px dashed #80cbc4; }}
-                        .creative-section:last-child {{ border-bottom: none; }}
-                        .creative-section h2 {{ color: #00acc1; margin-top: 0; margin-bottom: 12px; font-size: 1.8em; display: flex; align-items: center; gap: 8px; }}
-                        .creative-section p {{ margin-bottom: 10px; color: #333; line-height: 1.6; display: flex; align-items: center; gap: 8px; }}
-                        .creative-section p strong {{ font-weight: bold; color: #00695c; margin-right: 5px; }}
-                    </style>
-                </head>
-                <body>
-                    <div class="persona-card-creative">
-                        <div class="creative-header">
-                            <div class="user-photo-creative">{image_html}</div>
-                            <h1>✨ {persona_data.get('name', '')} ✨</h1>
-                            <p class="tagline">💼 {persona_data.get('occupation', '')} | 🗓️ {persona_data.get('age', '')} | 📍 {persona_data.get('location', '')}</p>
-                        </div>
-                        <div class="creative-section">
-                            <h2>🌍 My World</h2>
-                            <p><strong>👤 Gender:</strong> {persona_data.get('gender', '')}</p>
-                            <p><strong>💻 Tech Level:</strong> {persona_data.get('tech_savviness', 0)}/5</p>
-                            <p><strong>❤️ Passions:</strong> {', '.join(persona_data.get('interests', []) or [])}</p>
-                            <p><strong>📱 Platforms I Use:</strong> {', '.join(persona_data.get('platforms', []) or [])}</p>
-                        </div>
-                        <div class="creative-section">
-                            <h2>🚀 What Drives Me</h2>
-                            <p><strong>🎯 My Goals:</strong> {persona_data.get('goals', '')}</p>
-                            <p><strong>💡 My Motivations:</strong> {persona_data.get('motivations', '')}</p>
-                        </div>
-                        <div class="creative-section">
-                            <h2>🚧 My Challenges</h2>
-                            <p><strong>😠 Frustrations:</strong> {persona_data.get('frustrations', '')}</p>
-                            <p><strong>💔 Pain Points:</strong> {persona_data.get('pain_points', '')}</p>
-                            <p><strong>✅ My Needs:</strong> {persona_data.get('needs', '')}</p>
-                            <p><strong> skills:</strong> {persona_data.get('skills', '')}</p>
-                        </div>
-                    </div>
-                </body>
-                </html>
-                """.strip()
+<div class="persona-card-creative">
+    <div class="creative-header">
+        <div class="user-photo-creative" style="text-align: center;">{{ image_html|raw }}</div>
+        <h1>✨ {{ name }} ✨</h1>
+        <p class="tagline">💼 {{ occupation }} | 🗓️ {{ age }} | 📍 {{ location }}</p>
+    </div>
+    <div class="creative-section">
+        <h2>🌍 My World</h2>
+        <p><strong>👤 Gender:</strong> {{ gender }}</p>
+        <p><strong>💻 Tech Level:</strong> {{ tech_savviness }}/5</p>
+        <p><strong>❤️ Passions:</strong> {{ interests|join }}</p>
+        <p><strong>📱 Platforms I Use:</strong> {{ platforms|join }}</p>
+    </div>
+    <div class="creative-section">
+        <h2>🚀 What Drives Me</h2>
+        <p><strong>🎯 My Goals:</strong> {{ goals }}</p>
+        <p><strong>💡 My Motivations:</strong> {{ motivations }}</p>
+    </div>
+    <div class="creative-section">
+        <h2>🚧 My Challenges</h2>
+        <p><strong>😠 Frustrations:</strong> {{ frustrations }}</p>
+        <p><strong>💔 Pain Points:</strong> {{ pain_points }}</p>
+        <p><strong>✅ My Needs:</strong> {{ needs }}</p>
+        <p><strong>🛠 Skills:</strong> {{ skills }}</p>
+    </div>
+</div>
+""".strip()
 
 EMPTY_TEMPLATE = """
-                <html>
-                    <head>
-                        <style> body {{ font-family: sans-serif; }} </style>
-                    </head>
-                    <body>
-                        <h1>{persona_data.get('name', 'User Persona')}</h1>
-                        <p>Occupation: {persona_data.get('occupation', '')}</p>
-                    </body>
-                </html>
-                """.strip()
+<h1>{{ name }}</h1>
+<p>Occupation: {{ occupation }}</p>
+""".strip()
+
+# Standalone styles for the exported document (the preview uses css/styles.css)
+TEMPLATE_STYLES = {
+    "basic": """
+        .persona-card-basic { border: 1px solid #ddd; padding: 20px; border-radius: 5px; background-color: #f9f9f9; }
+        .persona-header { text-align: center; margin-bottom: 15px; }
+        .persona-header h2 { margin-bottom: 5px; color: #333; }
+        .persona-header .subtitle { color: #777; font-size: 0.9em; }
+        .persona-section { margin-bottom: 15px; padding-bottom: 10px; border-bottom: 1px solid #eee; }
+        .persona-section:last-child { border-bottom: none; }
+        .persona-section h3 { color: #555; margin-top: 0; margin-bottom: 10px; }
+        .persona-section p { margin-bottom: 5px; color: #444; }
+        .persona-section p strong { font-weight: bold; color: #333; margin-right: 5px; }
+        .user-photo { text-align: center; margin-bottom: 10px; }
+        .user-photo img { width: 100px; height: auto; border-radius: 50%; object-fit: cover; }
+    """,
+    "modern": """
+        .persona-card-modern-stacked { background-color: #fff; border-radius: 8px; box-shadow: 0 2px 10px rgba(0, 0, 0, 0.1); padding: 25px; }
+        .user-photo-modern-stacked img { width: 100px; height: 100px; border-radius: 50%; object-fit: cover; margin: 0 auto 15px auto; display: block; }
+        .modern-header { text-align: center; margin-bottom: 20px; }
+        .modern-header h2 { color: #2c3e50; margin-bottom: 8px; }
+        .modern-header .subtitle { color: #777; font-size: 0.9em; margin-bottom: 5px; }
+        .modern-header .tech-savvy { color: #3498db; font-size: 0.95em; }
+        .modern-section { margin-bottom: 18px; padding-bottom: 12px; border-bottom: 1px solid #eee; }
+        .modern-section:last-child { border-bottom: none; }
+        .modern-section h3 { color: #2c3e50; margin-top: 0; margin-bottom: 10px; font-size: 1.15em; }
+        .modern-section p { color: #555; margin-bottom: 0; font-size: 0.95em; line-height: 1.6; }
+    """,
+    "professional": """
+        .persona-card-professional { border: 1px solid #aaa; padding: 20px; border-radius: 3px; background-color: #f0f0f0; }
+        .professional-header { text-align: center; margin-bottom: 20px; }
+        .user-photo-professional img { width: 100px; height: 100px; border-radius: 50%; object-fit: cover; margin-bottom: 15px; }
+        .professional-header h2 { color: #222; margin-bottom: 5px; }
+        .professional-header .title { color: #555; font-size: 1em; margin-bottom: 3px; }
+        .professional-header .location { color: #777; font-size: 0.9em; }
+        .professional-section { margin-bottom: 18px; padding-bottom: 12px; border-bottom: 1px solid #ccc; }
+        .professional-section:last-child { border-bottom: none; }
+        .professional-section h3 { color: #333; margin-top: 0; margin-bottom: 10px; font-size: 1.2em; border-bottom: 2px solid #555; padding-bottom: 5px; display: flex; align-items: center; gap: 8px; }
+        .professional-section p { margin-bottom: 8px; color: #444; line-height: 1.5; display: flex; align-items: center; gap: 8px; }
+        .professional-section p strong { font-weight: bold; color: #222; margin-right: 5px; }
+    """,
+    "creative": """
+        .persona-card-creative { background-color: #e0f7fa; padding: 25px; border-radius: 10px; box-shadow: 0 4px 15px rgba(0, 0, 0, 0.08); border: 2px solid #b2ebf2; }
+        .creative-header { text-align: center; margin-bottom: 25px; }
+        .user-photo-creative img { width: 100px; height: 100px; border-radius: 50%; object-fit: cover; margin-bottom: 15px; }
+        .creative-header h1 { color: #00838f; margin-bottom: 5px; font-size: 2.5em; }
+        .creative-header .tagline { color: #26a69a; font-size: 1.1em; }
+        .creative-section { margin-bottom: 20px; padding-bottom: 15px; border-bottom: 2px dashed #80cbc4; }
+        .creative-section:last-child { border-bottom: none; }
+        .creative-section h2 { color: #00acc1; margin-top: 0; margin-bottom: 12px; font-size: 1.8em; display: flex; align-items: center; gap: 8px; }
+        .creative-section p { margin-bottom: 10px; color: #333; line-height: 1.6; display: flex; align-items: center; gap: 8px; }
+        .creative-section p strong { font-weight: bold; color: #00695c; margin-right: 5px; }
+    """,
+}
+
+DOCUMENT_TEMPLATE = """
+<html>
+<head>
+    <meta charset="utf-8">
+    <style>
+        body {{ font-family: sans-serif; }}
+        {styles}
+    </style>
+</head>
+<body>
+{card}
+</body>
+</html>
+""".strip()
+
+# Fields a card can reference, so rendering never needs the whole session state
+TEMPLATE_FIELDS = ("name", "age", "gender", "occupation", "location",
+                   "goals", "frustrations", "motivations", "needs", "skills",
+                   "pain_points", "tech_savviness", "interests", "platforms")
+
+_PLACEHOLDER = re.compile(r"\{\{\s*(\w+)\s*(?:\|\s*(\w+)\s*)?\}\}")
+
+
+def _escape(value):
+    return html.escape("" if value is None else str(value))
+
+
+def _join(values):
+    return html.escape(", ".join(str(v) for v in values)) if values else "None"
+
+
+def _stars(value):
+    try:
+        return "⭐" * int(value or 0)
+    except (TypeError, ValueError):
+        return ""
+
+
+def _raw(value):
+    return "" if value is None else str(value)
+
+
+_FILTERS = {None: _escape, "join": _join, "stars": _stars, "raw": _raw}
+
+
+def compile_template(source):
+    """Parse a template once into a render(context) function"""
+    parts = []
+    position = 0
+    for match in _PLACEHOLDER.finditer(source):
+        if match.start() > position:
+            parts.append(source[position:match.start()])
+        field, filter_name = match.group(1), match.group(2)
+        if filter_name not in _FILTERS:
+            raise ValueError(f"Unknown template filter: {filter_name}")
+        parts.append((field, _FILTERS[filter_name]))
+        position = match.end()
+    if position < len(source):
+        parts.append(source[position:])
+
+    # Pre-bind everything so rendering is a single join over the parts
+    def render(context):
+        get = context.get
+        return "".join(part if isinstance(part, str) else part[1](get(part[0]))
+                       for part in parts)
+
+    return render
+
+
+TEMPLATES = {
+    "basic": compile_template(BASIC_TEMPLATE),
+    "modern": compile_template(MODERN_TEMPLATE),
+    "professional": compile_template(PROFESSIONAL_TEMPLATE),
+    "creative": compile_template(CREATIVE_TEMPLATE),
+}
+_EMPTY = compile_template(EMPTY_TEMPLATE)
+
+# Shared by every session's script thread, always used under _cache_lock
+_cache_lock = threading.Lock()
+_render_cache = OrderedDict()
+_RENDER_CACHE_SIZE = 256
+
+
+def persona_revision(persona_data):
+    """Digest of the fields a card renders, used when no explicit revision is available"""
+    return content_digest(*(repr(persona_data.get(field)) for field in TEMPLATE_FIELDS))
+
+
+def photo_key(photo_bytes, size, image_format="JPEG"):
+    """Identity of photo_html(photo_bytes, size, image_format), None without a photo"""
+    if not photo_bytes:
+        return None
+    return source_digest(photo_bytes), size, image_format.upper()
+
+
+def photo_html(photo_bytes, size, image_format="JPEG"):
+    """<img> tag for a `size` px thumbnail of the photo (never the full-size image)"""
+    if not photo_bytes:
+        return ""
+    # The data URI is cached (and its reuse counted) in app.utils.images
+    return (f'<img src="{photo_data_uri(photo_bytes, size, image_format)}" alt="User Photo" '
+            f'style="width: {size}px; height: {size}px; border-radius: 50%; '
+            f'object-fit: cover; margin-bottom: 10px;">')
+
+
+def render_persona_card(template, persona_data, image_html="", revision=None, image_key=None):
+    """Card markup shared by the preview and the exported document.
+
+    Pass the photo_key() of a photo_html() tag as image_key, so the cache need not
+    hash the tag's data URI; other image markup is hashed.
+    """
+    if revision is None:
+        revision = persona_revision(persona_data)
+    if image_key is None and image_html:
+        image_key = content_digest(image_html)
+    key = (template, revision, image_key)
+    with _cache_lock:
+        card = _render_cache.get(key)
+        if card is not None:
+            _render_cache.move_to_end(key)
+            return card
+    context = {field: persona_data.get(field) for field in TEMPLATE_FIELDS}
+    context["image_html"] = image_html
+    card = TEMPLATES.get(template, _EMPTY)(context)
+    with _cache_lock:
+        _render_cache[key] = card
+        if len(_render_cache) > _RENDER_CACHE_SIZE:
+            _render_cache.popitem(last=False)
+    return card
+
+
+def render_persona_document(template, persona_data, image_html="", revision=None, image_key=None):
+    """Full standalone HTML document, as fed to the PDF backends"""
+    return DOCUMENT_TEMPLATE.format(
+        styles=TEMPLATE_STYLES.get(template, ""),
+        card=render_persona_card(template, persona_data, image_html, revision, image_key))
@@ -10,5 +10,19 @@ def load_css():
         st.warning("Styles CSS File Not Found in the Project Folder !!!")
 
 
+def configure_gemini():
+    # Only check the key on page load, google.generativeai is imported and
+    # configured with it on first use (app.services.llm_client.get_model)
+    try:
+        if not st.secrets["GEMINI_API_KEY"]:
+            raise KeyError("GEMINI_API_KEY")
+    except KeyError:
+        st.error("🔐 API key missing! Please add it to secrets.toml")
+        st.stop()  # Halt the app if key is missing
+    except Exception as e:
+        st.error(f"🚨 API error: {str(e)}")
+        st.stop()
+
+
 def persona_preview(persona_form_data):
     pass
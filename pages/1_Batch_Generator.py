@@ -0,0 +1,120 @@
+import streamlit as st
+
+from lib.utils import configure_gemini, load_css
+from app.models.persona import Persona
+from app.services.batch_generator import generate_persona_batch, personas_to_jsonl, personas_to_zip
+from app.services.persona_session import session_id
+from app.services.persona_store import get_persona_store
+from app.services.rate_limiter import get_limiter, rate_limit_context
+
+# Page Title
+st.set_page_config(page_title="Batch Persona Generator",
+                   page_icon=":rocket:", layout="wide")
+
+# Load Styles
+load_css()
+
+configure_gemini()
+
+st.markdown("<h1 class='persona-header'>Batch Persona Generator</h1>",
+            unsafe_allow_html=True)
+
+col_settings, col_results = st.columns([0.4, 0.6])
+
+with col_settings:
+    count = st.number_input("Number of personas", min_value=1,
+                            max_value=500, value=50, step=10)
+    concurrency = st.slider("Parallel workers", min_value=1,
+                            max_value=16, value=4)
+    requests_per_minute = st.number_input(
+        "Gemini requests per minute", min_value=1, max_value=1000, value=30,
+        help="Requests are spaced to stay under this budget, 429s back off all workers")
+    personas_per_request = st.slider(
+        "Personas per request", min_value=1, max_value=10, value=5,
+        help="Ask Gemini for several personas in one call, fewer requests and prompt tokens per persona")
+    photo_provider = st.selectbox(
+        "Photos", ["none", "randomuser", "stability", "huggingface", "local"],
+        format_func=lambda x: "No photos" if x == "none" else x.capitalize())
+    distinct = st.checkbox(
+        "Skip near-duplicates", value=True,
+        help="Drop personas whose goals, frustrations and pain points nearly repeat another one "
+             "(in this batch or in the library) and request replacements")
+
+    start = st.button("Generate Batch", type="primary",
+                      use_container_width=True)
+    queue_wait = get_limiter("gemini").estimate_wait("batch")
+    if queue_wait >= 1:
+        st.caption(f"Gemini is busy, batch requests currently wait about {queue_wait:.0f}s for a slot")
+
+with col_results:
+    if start:
+        progress = st.progress(0.0, text="Starting...")
+        # Partial results survive a rerun or the user leaving the page mid-batch
+        st.session_state["batch_personas"] = []
+        st.session_state["batch_errors"] = []
+        st.session_state["batch_saved"] = False
+        st.session_state["batch_exports"] = {}
+
+        def on_progress(result, personas, error):
+            st.session_state["batch_personas"].extend(personas)
+            if error is not None:
+                st.session_state["batch_errors"].append(str(error))
+            duplicates = f", {result.duplicates} near-duplicates replaced" if result.duplicates else ""
+            progress.progress(result.completed / result.requested,
+                              text=f"{len(result.personas)} generated, {result.failed} failed of {result.requested}{duplicates}")
+
+        secrets = {key: st.secrets.get(key)
+                   for key in ("STABILITY_API_KEY", "HUGGINGFACE_TOKEN")}
+        # Batches share the Gemini quota fairly with other sessions, behind interactive requests
+        with rate_limit_context(session=session_id()):
+            generate_persona_batch(
+                int(count), concurrency=concurrency, requests_per_minute=int(requests_per_minute),
+                personas_per_request=personas_per_request,
+                photo_provider=None if photo_provider == "none" else photo_provider,
+                secrets=secrets, on_progress=on_progress,
+                distinct=distinct, library=get_persona_store() if distinct else None)
+
+    personas = st.session_state.get("batch_personas", [])
+    errors = st.session_state.get("batch_errors", [])
+
+    def batch_export(kind, build):
+        """Export bytes built once per batch, later reruns of the page reuse them"""
+        exports = st.session_state.setdefault("batch_exports", {})
+        # Rebuilt when the batch grew since, e.g. a rerun interrupted it mid-way
+        count, data = exports.get(kind, (None, None))
+        if count != len(personas):
+            data = build(personas)
+            exports[kind] = (len(personas), data)
+        return data
+
+    if personas:
+        st.success(f"✅ {len(personas)} personas ready")
+        st.dataframe([{k: v for k, v in p.items() if k != "user_photo"} for p in personas],
+                     use_container_width=True)
+
+        col_jsonl, col_zip, col_library = st.columns(3)
+        with col_jsonl:
+            st.download_button("Download JSONL", data=batch_export("jsonl", personas_to_jsonl),
+                               file_name="personas.jsonl", mime="application/jsonl",
+                               use_container_width=True)
+        with col_zip:
+            st.download_button("Download ZIP", data=batch_export("zip", personas_to_zip),
+                               file_name="personas.zip", mime="application/zip",
+                               use_container_width=True)
+        with col_library:
+            saved = st.session_state.get("batch_saved", False)
+            if st.button("Saved to Library" if saved else "Save to Library", disabled=saved,
+                         use_container_width=True):
+                # One transaction for the whole batch, near-duplicates of stored personas are skipped
+                ids = get_persona_store().save_many([Persona.from_dict(p) for p in personas],
+                                                    skip_duplicates=True)
+                st.session_state["batch_saved"] = True
+                skipped = ids.count(None)
+                if skipped:
+                    st.toast(f"{skipped} near-duplicates of library personas were not saved")
+                st.rerun()
+
+    if errors:
+        with st.expander(f"⚠️ {len(errors)} failed"):
+            for error in errors:
+                st.write(error)
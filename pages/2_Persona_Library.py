@@ -0,0 +1,94 @@
+import streamlit as st
+from datetime import datetime
+
+from lib.utils import load_css
+from app.models.persona import GENDER_OPTIONS, INTEREST_OPTIONS, PLATFORM_OPTIONS
+from app.services.persona_store import get_persona_store
+
+PAGE_SIZE = 25
+
+# Page Title
+st.set_page_config(page_title="Persona Library",
+                   page_icon=":rocket:", layout="wide")
+
+# Load Styles
+load_css()
+
+st.markdown("<h1 class='persona-header'>Persona Library</h1>",
+            unsafe_allow_html=True)
+
+store = get_persona_store()
+
+with st.expander("🔎 Filters", expanded=True):
+    col_occupation, col_gender, col_age, col_tech = st.columns([0.3, 0.2, 0.3, 0.2])
+    with col_occupation:
+        occupation = st.text_input("Occupation starts with", placeholder="e.g. Designer")
+    with col_gender:
+        gender = st.selectbox("Gender", ["Any"] + GENDER_OPTIONS)
+    with col_age:
+        min_age, max_age = st.slider("Age", min_value=0, max_value=100, value=(0, 100))
+    with col_tech:
+        tech_savviness = st.selectbox("Tech Savviness", ["Any", 1, 2, 3, 4, 5])
+    col_interests, col_platforms = st.columns(2)
+    with col_interests:
+        interests = st.multiselect("Has all interests", INTEREST_OPTIONS)
+    with col_platforms:
+        platforms = st.multiselect("Uses all platforms", PLATFORM_OPTIONS)
+
+filters = {
+    "occupation": occupation,
+    "gender": None if gender == "Any" else gender,
+    "min_age": min_age if min_age > 0 else None,
+    "max_age": max_age if max_age < 100 else None,
+    "tech_savviness": None if tech_savviness == "Any" else tech_savviness,
+    "interests": interests,
+    "platforms": platforms,
+}
+
+# Cursors of the pages visited so far, back to the first one when the filters change
+if st.session_state.get("library_filters") != filters:
+    st.session_state["library_filters"] = filters
+    st.session_state["library_cursors"] = [None]
+cursors = st.session_state["library_cursors"]
+
+page, next_cursor = store.search(limit=PAGE_SIZE, after_id=cursors[-1], **filters)
+if not page and len(cursors) > 1:
+    # Everything on this page was deleted, step back
+    cursors.pop()
+    st.rerun()
+total = store.count(**filters)
+
+st.caption(f"{total} personas match, page {len(cursors)} of {max(1, -(-total // PAGE_SIZE))}")
+
+if not page:
+    st.info("No personas found. Save one from the builder or the batch generator.")
+else:
+    st.dataframe([dict(row, updated_at=datetime.fromtimestamp(row["updated_at"]).strftime("%Y-%m-%d %H:%M"))
+                  for row in page],
+                 use_container_width=True, hide_index=True)
+
+    col_previous, col_next, col_space = st.columns([0.15, 0.15, 0.7])
+    with col_previous:
+        if st.button("← Previous", disabled=len(cursors) == 1, use_container_width=True):
+            cursors.pop()
+            st.rerun()
+    with col_next:
+        if st.button("Next →", disabled=next_cursor is None, use_container_width=True):
+            cursors.append(next_cursor)
+            st.rerun()
+
+    rows = {row["id"]: row for row in page}
+    selected = st.selectbox(
+        "Persona", list(rows),
+        format_func=lambda library_id: f"{rows[library_id]['name']} - {rows[library_id]['occupation']} ({rows[library_id]['age']})")
+
+    col_load, col_delete, col_space = st.columns([0.2, 0.2, 0.6])
+    with col_load:
+        if st.button("Load into form", type="primary", use_container_width=True):
+            # The builder page picks it up after its own initialization
+            st.session_state["library_selection"] = selected
+            st.switch_page("index.py")
+    with col_delete:
+        if st.button("Delete", use_container_width=True):
+            store.delete(selected)
+            st.rerun()
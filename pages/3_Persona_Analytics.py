@@ -0,0 +1,108 @@
+import streamlit as st
+
+from lib.utils import load_css
+from app.models.persona import GENDER_OPTIONS, INTEREST_OPTIONS, PLATFORM_OPTIONS
+from app.services.persona_analytics import AGE_BIN_LABELS, PersonaColumns, get_library_analytics
+
+# Page Title
+st.set_page_config(page_title="Persona Analytics",
+                   page_icon=":rocket:", layout="wide")
+
+# Load Styles
+load_css()
+
+st.markdown("<h1 class='persona-header'>Persona Analytics</h1>",
+            unsafe_allow_html=True)
+
+
+def batch_columns():
+    """Columns of this session's batch, extended with only the personas added since the last run"""
+    personas = st.session_state.get("batch_personas", [])
+    cached = st.session_state.get("batch_analytics")
+    # A new batch starts a new list
+    if cached is None or cached["personas"] is not personas:
+        cached = st.session_state["batch_analytics"] = {"personas": personas, "columns": PersonaColumns()}
+    columns = cached["columns"]
+    columns.add_personas(personas[len(columns):])
+    return columns
+
+
+def bar_chart(label, options, counts):
+    st.bar_chart({label: options, "Personas": [int(count) for count in counts]},
+                 x=label, y="Personas")
+
+
+def matrix_table(label, rows, columns, matrix):
+    data = {label: rows}
+    data.update({column: matrix[:, j] for j, column in enumerate(columns)})
+    st.dataframe(data, use_container_width=True, hide_index=True)
+
+
+col_source, col_gender, col_age, col_interest, col_platform = st.columns([0.2, 0.2, 0.2, 0.2, 0.2])
+with col_source:
+    source = st.radio("Personas", ["Library", "Current batch"], horizontal=True)
+with col_gender:
+    gender = st.selectbox("Gender", ["Any"] + GENDER_OPTIONS)
+with col_age:
+    min_age, max_age = st.slider("Age", min_value=0, max_value=100, value=(0, 100))
+with col_interest:
+    interest = st.selectbox("Interest", ["Any"] + INTEREST_OPTIONS)
+with col_platform:
+    platform = st.selectbox("Platform", ["Any"] + PLATFORM_OPTIONS)
+
+filtered = gender != "Any" or min_age > 0 or max_age < 100 or interest != "Any" or platform != "Any"
+
+if source == "Library":
+    # The shared summary only recomputes when personas were saved since the last view.
+    # Filters run on a snapshot, other sessions' refreshes don't touch it
+    columns, summary = get_library_analytics().snapshot()
+else:
+    columns = batch_columns()
+    summary = None
+
+if filtered or summary is None:
+    selection = None
+    if filtered:
+        selection = columns.select(
+            gender=None if gender == "Any" else gender,
+            min_age=min_age if min_age > 0 else None,
+            max_age=max_age if max_age < 100 else None,
+            interest=None if interest == "Any" else interest,
+            platform=None if platform == "Any" else platform)
+    summary = columns.summary(selection)
+
+if not summary["count"]:
+    st.info("No personas to analyze yet. Save some to the library or run a batch.")
+    st.stop()
+
+col_count, col_mean, col_median, col_tech = st.columns(4)
+col_count.metric("Personas", summary["count"])
+col_mean.metric("Mean age", f"{summary['age_mean']:.1f}")
+col_median.metric("Median age", f"{summary['age_median']:.0f}")
+col_tech.metric("Avg. tech savviness", f"{summary['tech_savviness_mean']:.2f}")
+
+col_left, col_right = st.columns(2)
+with col_left:
+    st.subheader("Age")
+    bar_chart("Age", AGE_BIN_LABELS, summary["age_histogram"])
+    st.subheader("Interests")
+    bar_chart("Interest", INTEREST_OPTIONS, summary["interests"])
+with col_right:
+    st.subheader("Gender")
+    bar_chart("Gender", GENDER_OPTIONS, summary["gender"])
+    st.subheader("Tech Savviness")
+    bar_chart("Tech savviness", ["1", "2", "3", "4", "5"], summary["tech_savviness"])
+
+st.subheader("Platforms")
+bar_chart("Platform", PLATFORM_OPTIONS, summary["platforms"])
+
+st.subheader("Co-occurrence")
+st.caption("Personas having both options. The diagonal is the count for the option alone.")
+tab_interests, tab_platforms, tab_cross = st.tabs(
+    ["Interest × Interest", "Platform × Platform", "Interest × Platform"])
+with tab_interests:
+    matrix_table("Interest", INTEREST_OPTIONS, INTEREST_OPTIONS, summary["interest_cooccurrence"])
+with tab_platforms:
+    matrix_table("Platform", PLATFORM_OPTIONS, PLATFORM_OPTIONS, summary["platform_cooccurrence"])
+with tab_cross:
+    matrix_table("Interest", INTEREST_OPTIONS, PLATFORM_OPTIONS, summary["interest_platform"])
@@ -0,0 +1,70 @@
+import pytest
+
+from app.services.avatar_providers import PROVIDERS, AvatarGenerationError, generate_avatar
+from app.services.avatar_service import ModelLoadingError
+from app.services.job_runner import JobRunner
+
+SECRETS = {"STABILITY_API_KEY": "key"}
+
+
+class FakeFetches:
+    """Stands in for every provider's fetch: records the calls, returns or raises the
+    outcome set for that provider (a list is consumed one attempt at a time)"""
+
+    def __init__(self):
+        self.calls = []
+        self.outcomes = {}
+
+    def fetch(self, name):
+        def fetch(fields, secrets):
+            self.calls.append(name)
+            outcome = self.outcomes[name]
+            if isinstance(outcome, list):
+                outcome = outcome.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+        return fetch
+
+
+@pytest.fixture
+def fetches(monkeypatch):
+    fetches = FakeFetches()
+    for name, provider in PROVIDERS.items():
+        monkeypatch.setattr(provider, "_fetch", fetches.fetch(name))
+    monkeypatch.delenv("AVATAR_FAILOVER", raising=False)
+    return fetches
+
+
+def persona(name):
+    # A fresh name per test, the Hugging Face and Stability images are cached by prompt
+    return {"name": name, "age": 30, "gender": "Female", "occupation": "Nurse"}
+
+
+def test_loading_model_is_not_skipped_with_default_failover(fetches):
+    fetches.outcomes.update(huggingface=ModelLoadingError(5.0), stability=b"stability", randomuser=b"random")
+
+    with pytest.raises(AvatarGenerationError) as raised:
+        generate_avatar(persona("Loading Lena"), SECRETS, preferred="huggingface")
+
+    assert raised.value.retry_after == 5.0
+    assert fetches.calls == ["huggingface"]
+
+
+def test_real_failure_still_fails_over(fetches):
+    fetches.outcomes.update(huggingface=RuntimeError("boom"), stability=b"stability", randomuser=b"random")
+
+    assert generate_avatar(persona("Failing Fred"), SECRETS, preferred="huggingface") == b"stability"
+    assert fetches.calls == ["huggingface", "stability"]
+
+
+def test_avatar_job_re_polls_loading_model(fetches):
+    fetches.outcomes.update(huggingface=[ModelLoadingError(0.1), b"huggingface"], stability=b"stability",
+                            randomuser=b"random")
+    runner = JobRunner(max_workers=1)
+
+    job = runner.submit(generate_avatar, persona("Patient Pat"), SECRETS, "huggingface", deadline=30.0)
+
+    assert job.wait(10)
+    assert (job.status, job.result, job.attempts) == ("done", b"huggingface", 2)
+    assert fetches.calls == ["huggingface", "huggingface"]
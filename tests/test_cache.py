@@ -0,0 +1,25 @@
+from app.utils.cache import BlobCache
+
+
+def test_clear_without_disk_tier_leaves_working_directory_alone(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    unrelated = tmp_path / "unrelated.bin"
+    unrelated.write_bytes(b"not a cache entry")
+    cache = BlobCache("memory-only")
+    cache.put("key", b"value")
+
+    cache.clear()
+
+    assert unrelated.read_bytes() == b"not a cache entry"
+    assert cache.get("key") is None
+    assert cache.stats()["disk_bytes"] == 0
+
+
+def test_clear_removes_disk_entries(tmp_path):
+    cache = BlobCache("disk", disk_dir=str(tmp_path / "cache"))
+    cache.put("key", b"value")
+
+    cache.clear()
+
+    assert list((tmp_path / "cache").iterdir()) == []
+    assert cache.get("key") is None
@@ -0,0 +1,124 @@
+"""Load test for the headless HTTP API (app/api.py).
+
+Fires a mix of requests from concurrent clients and prints latency percentiles,
+throughput and status codes per endpoint. Against the stub upstreams:
+
+    python -m tools.stub_server --port 8765 --latency 300
+    RANDOMUSER_BASE_URL=http://127.0.0.1:8765 GEMINI_BASE_URL=http://127.0.0.1:8765 \
+    GEMINI_API_KEY=stub LLM_SEED_VARIANTS=8 uvicorn app.api:app --port 8000
+    python -m tools.api_load_test --url http://127.0.0.1:8000 --concurrency 32 --requests 500
+"""
+import argparse
+import base64
+import collections
+import random
+import statistics
+import sys
+import threading
+import time
+
+import requests
+
+from tools.stub_server import make_persona, make_png
+
+# endpoint -> (method, path, share of the request mix)
+ENDPOINTS = {
+    "generate": ("POST", "/personas", 0.2),
+    "preview": ("POST", "/personas/preview", 0.35),
+    "pdf": ("POST", "/personas/pdf", 0.25),
+    "avatar": ("POST", "/avatars", 0.2),
+}
+TEMPLATES = ["basic", "modern", "professional", "creative"]
+
+
+def request_body(endpoint, rng, photo):
+    if endpoint == "generate":
+        # Uncached calls would mostly measure the Gemini quota (needs LLM_SEED_VARIANTS set)
+        return {"avatar": "randomuser", "cached": True}
+    persona = make_persona()
+    if endpoint == "avatar":
+        return dict(persona, provider="randomuser")
+    return {"persona": persona, "photo": photo, "template": rng.choice(TEMPLATES)}
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def run(url, endpoints, total, concurrency, timeout):
+    weights = [ENDPOINTS[name][2] for name in endpoints]
+    photo = base64.b64encode(make_png(256)).decode("ascii")
+    latencies = collections.defaultdict(list)
+    statuses = collections.defaultdict(collections.Counter)
+    lock = threading.Lock()
+    remaining = iter(range(total))
+
+    def client(number):
+        rng = random.Random(number)
+        session = requests.Session()
+        # One rate limit session per simulated client
+        session.headers["X-Client-Id"] = f"load-{number}"
+        while True:
+            with lock:
+                if next(remaining, None) is None:
+                    return
+            endpoint = rng.choices(endpoints, weights)[0]
+            method, path, _ = ENDPOINTS[endpoint]
+            started = time.perf_counter()
+            try:
+                status = session.request(method, url + path, json=request_body(endpoint, rng, photo),
+                                         timeout=timeout).status_code
+            except requests.exceptions.RequestException as e:
+                status = type(e).__name__
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies[endpoint].append(elapsed)
+                statuses[endpoint][status] += 1
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started, latencies, statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent clients")
+    parser.add_argument("--requests", type=int, default=200, help="Requests in total")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS),
+                        help=f"Comma separated mix out of: {', '.join(ENDPOINTS)}")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    args = parser.parse_args()
+
+    endpoints = [name.strip() for name in args.endpoints.split(",") if name.strip()]
+    unknown = [name for name in endpoints if name not in ENDPOINTS]
+    if unknown or not endpoints:
+        sys.exit(f"Unknown endpoints: {', '.join(unknown)}")
+    requests.get(args.url + "/health", timeout=10).raise_for_status()
+
+    elapsed, latencies, statuses = run(args.url.rstrip("/"), endpoints, args.requests,
+                                       args.concurrency, args.timeout)
+
+    print(f"{args.requests} requests from {args.concurrency} clients in {elapsed:.1f}s "
+          f"({args.requests / elapsed:.1f} req/s)")
+    print(f"{'endpoint':<10} {'count':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'mean ms':>8}  statuses")
+    for endpoint in endpoints:
+        values = latencies.get(endpoint)
+        if not values:
+            continue
+        codes = ", ".join(f"{status}: {count}" for status, count in sorted(statuses[endpoint].items(), key=str))
+        print(f"{endpoint:<10} {len(values):>6} {percentile(values, 0.5) * 1000:8.0f} "
+              f"{percentile(values, 0.95) * 1000:8.0f} {percentile(values, 0.99) * 1000:8.0f} "
+              f"{statistics.mean(values) * 1000:8.0f}  {codes}")
+    failed = sum(count for counter in statuses.values()
+                 for status, count in counter.items() if status != 200)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,184 @@
+"""Bulk PDF renderer for exported personas.
+
+Reads persona JSON in the shape the builder and the batch page export: JSONL
+files (one persona per line), JSON files (one persona or a list) and directories
+of them, e.g. an unzipped batch export, where persona_0001.jpg (or .png, .webp)
+next to persona_0001.json is used as its photo. Every persona is rendered with each
+requested template on a process pool:
+
+    python -m tools.render_personas personas.jsonl batch_export/ --out pdfs --template all --workers 8
+
+Outputs whose HTML is unchanged since the last run (same digest as in the
+manifest in --out) are skipped, so re-running only renders what changed.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from app.models.persona import Persona
+from app.services.pdf_backends import get_pdf_backend
+from app.services.pdf_export import pdf_revision
+from app.services.rendering import pdf_document
+from app.utils.config import get_setting
+from app.utils.templates import TEMPLATES
+
+MANIFEST = ".render-manifest.json"
+PHOTO_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+
+
+def input_files(paths):
+    """(path, name) of every .json/.jsonl input, name being its output stem"""
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for file in sorted(files):
+                    if file.endswith((".json", ".jsonl")):
+                        full = os.path.join(root, file)
+                        # Keep the directory layout so equal file names don't clash
+                        yield full, os.path.splitext(os.path.relpath(full, path))[0]
+        else:
+            yield path, os.path.splitext(os.path.basename(path))[0]
+
+
+def sibling_photo(path):
+    stem = os.path.splitext(path)[0]
+    for extension in PHOTO_EXTENSIONS:
+        if os.path.exists(stem + extension):
+            return stem + extension
+    return None
+
+
+def read_personas(paths):
+    """Yield (name, persona dict, photo path or None) one at a time, big JSONL files
+    are never loaded whole. Unreadable records are reported and skipped"""
+    for path, name in input_files(paths):
+        try:
+            if path.endswith(".jsonl"):
+                with open(path, encoding="utf-8") as f:
+                    for number, line in enumerate(f, start=1):
+                        if not line.strip():
+                            continue
+                        try:
+                            yield f"{name}_{number:05d}", json.loads(line), None
+                        except json.JSONDecodeError as e:
+                            print(f"{path}:{number}: skipped, invalid JSON ({e})", file=sys.stderr)
+                continue
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"{path}: skipped ({e})", file=sys.stderr)
+            continue
+        if isinstance(data, list):
+            for number, persona in enumerate(data, start=1):
+                yield f"{name}_{number:05d}", persona, None
+        else:
+            yield name, data, sibling_photo(path)
+
+
+def render_task(template, persona_data, photo_path, out_path, known_revision):
+    """Runs in a worker: (status, out_path, revision), status "rendered" or "skipped" """
+    photo = None
+    if photo_path:
+        with open(photo_path, "rb") as f:
+            photo = f.read()
+    html_content = pdf_document(template, persona_data, photo)
+    # Content-based, unlike the builder's: the HTML embeds the fields, the markup and the photo
+    revision = pdf_revision(html_content)
+    if revision == known_revision and os.path.exists(out_path):
+        return "skipped", out_path, revision
+    pdf_bytes = get_pdf_backend().render(
+        html_content, dict(persona_data, user_photo=photo, selected_template=template))
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    # Never leave a half-written PDF behind for the next run to trust
+    partial_path = out_path + ".part"
+    with open(partial_path, "wb") as f:
+        f.write(pdf_bytes)
+    os.replace(partial_path, out_path)
+    return "rendered", out_path, revision
+
+
+def load_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def save_manifest(out_dir, manifest):
+    path = os.path.join(out_dir, MANIFEST)
+    with open(path + ".part", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=0, sort_keys=True)
+    os.replace(path + ".part", path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("inputs", nargs="+", help="JSONL/JSON files or directories of them")
+    parser.add_argument("--out", default="pdfs", help="Output directory")
+    parser.add_argument("--template", action="append", choices=list(TEMPLATES) + ["all"],
+                        help="Template to render with, repeatable (default: basic)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="Rendering processes")
+    parser.add_argument("--force", action="store_true", help="Re-render outputs that are up to date")
+    args = parser.parse_args()
+
+    templates = args.template or ["basic"]
+    if "all" in templates:
+        templates = list(TEMPLATES)
+    os.makedirs(args.out, exist_ok=True)
+    manifest = {} if args.force else load_manifest(args.out)
+    counts = {"rendered": 0, "skipped": 0, "failed": 0}
+    # Keeps the queue short so input is read as the workers catch up
+    max_pending = max(1, args.workers) * 4
+    pending = {}
+
+    def collect(futures):
+        for future in futures:
+            out_path = pending.pop(future)
+            try:
+                status, _, revision = future.result()
+            except Exception as e:
+                counts["failed"] += 1
+                print(f"{out_path}: failed ({e})", file=sys.stderr)
+                continue
+            counts[status] += 1
+            manifest[os.path.relpath(out_path, args.out)] = revision
+
+    started = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=max(1, args.workers)) as executor:
+            for name, data, photo_path in read_personas(args.inputs):
+                try:
+                    if not isinstance(data, dict):
+                        raise TypeError("expected a JSON object")
+                    persona_data = Persona.from_dict(data).to_dict()
+                except (TypeError, ValueError) as e:
+                    counts["failed"] += 1
+                    print(f"{name}: skipped, not a persona ({e})", file=sys.stderr)
+                    continue
+                for template in templates:
+                    out_path = os.path.join(args.out, f"{name}_{template}.pdf")
+                    future = executor.submit(render_task, template, persona_data, photo_path, out_path,
+                                             manifest.get(os.path.relpath(out_path, args.out)))
+                    pending[future] = out_path
+                    if len(pending) >= max_pending:
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        collect(done)
+            collect(wait(pending)[0])
+    finally:
+        # Also after Ctrl+C, so finished outputs are skipped next time
+        save_manifest(args.out, manifest)
+
+    elapsed = time.perf_counter() - started
+    print(f"{counts['rendered']} rendered, {counts['skipped']} up to date, {counts['failed']} failed "
+          f"in {elapsed:.1f}s ({counts['rendered'] / elapsed if elapsed else 0:.1f} pages/s, "
+          f"{args.workers} workers, {get_setting('PDF_BACKEND', 'pdfkit')} backend)")
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
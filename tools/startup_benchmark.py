@@ -0,0 +1,110 @@
+"""Cold-start import benchmark for the Streamlit pages.
+
+Imports everything the pages import, in a fresh interpreter under -X importtime,
+prints the slowest modules and exits non-zero when the app's own import time goes
+over budget or a heavy SDK gets pulled in at page load:
+
+    python -m tools.startup_benchmark --budget-ms 150 --runs 5
+"""
+import argparse
+import ast
+import glob
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Imported first and not counted, every page pays for it anyway
+FRAMEWORK = ["streamlit"]
+
+# Must only be imported on the code path that needs them
+HEAVY_MODULES = ["google.generativeai", "google.genai", "PIL", "pdfkit", "fpdf", "requests",
+                 "torch", "diffusers", "transformers", "numpy"]
+
+
+def page_imports(paths):
+    """Top-level modules imported by the page scripts, in order"""
+    modules = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            tree = ast.parse(f.read(), path)
+        for node in tree.body:
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                names = [node.module]
+            else:
+                continue
+            modules += [name for name in names if name not in modules and name not in FRAMEWORK]
+    return modules
+
+
+def parse_importtime(stderr):
+    """(name, depth, self_us, cumulative_us) for every line of -X importtime output"""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line.split(":", 1)[1].split("|", 2)
+        # One leading space, then two more per nesting level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+    return entries
+
+
+def measure(modules):
+    code = "\n".join(f"import {name}" for name in FRAMEWORK + modules)
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        sys.exit(f"Importing the pages failed:\n{result.stderr[-2000:]}")
+    entries = parse_importtime(result.stderr)
+
+    # Children are printed before their parent, so everything after the last
+    # framework root belongs to the app
+    start = max(i for i, (name, depth, _, _) in enumerate(entries)
+                if depth == 0 and name in FRAMEWORK) + 1
+    app_entries = entries[start:]
+    total_us = sum(cumulative for _, depth, _, cumulative in app_entries if depth == 0)
+    return total_us, app_entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("pages", nargs="*", help="Page scripts (default: index.py and pages/*.py)")
+    parser.add_argument("--budget-ms", type=float, default=150.0,
+                        help="Max import time of the app modules, framework excluded")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh interpreters to measure, the median counts")
+    parser.add_argument("--top", type=int, default=15, help="Slowest modules to list")
+    args = parser.parse_args()
+
+    pages = args.pages or [os.path.join(ROOT, "index.py")] + sorted(glob.glob(os.path.join(ROOT, "pages", "*.py")))
+    modules = page_imports(pages)
+
+    runs = sorted((measure(modules) for _ in range(max(1, args.runs))), key=lambda run: run[0])
+    _, entries = runs[len(runs) // 2]
+    median_ms = statistics.median(run[0] for run in runs) / 1000
+
+    print(f"App imports ({', '.join(modules)})")
+    print(f"{'self ms':>9} {'cumul ms':>9}  module")
+    for name, depth, self_us, cumulative_us in sorted(entries, key=lambda e: e[3], reverse=True)[:args.top]:
+        print(f"{self_us / 1000:9.1f} {cumulative_us / 1000:9.1f}  {'  ' * depth}{name}")
+
+    failures = []
+    heavy = sorted({module for name, _, _, _ in entries
+                    for module in HEAVY_MODULES if name == module or name.startswith(module + ".")})
+    if heavy:
+        failures.append(f"heavy modules imported at startup: {', '.join(heavy)}")
+    if median_ms > args.budget_ms:
+        failures.append(f"app import time {median_ms:.0f} ms exceeds the {args.budget_ms:.0f} ms budget")
+
+    print(f"\nMedian app import time over {len(runs)} run(s): {median_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+"""Local stand-in for randomuser.me, Hugging Face inference, Stability AI and Gemini.
+
+Point the app (or the HTTP API) at it for offline development or load tests:
+
+    python -m tools.stub_server --port 8765 --latency 200 --error-rate 0.1
+    RANDOMUSER_BASE_URL=http://127.0.0.1:8765 HUGGINGFACE_BASE_URL=http://127.0.0.1:8765 \
+    STABILITY_BASE_URL=http://127.0.0.1:8765 GEMINI_BASE_URL=http://127.0.0.1:8765 \
+    streamlit run index.py
+"""
+import argparse
+import json
+import random
+import re
+import struct
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def make_png(size=64, color=(120, 144, 156)):
+    """Solid-colour PNG built by hand so the stub needs no imaging library"""
+    def chunk(kind, data):
+        return (struct.pack(">I", len(data)) + kind + data
+                + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF))
+
+    row = b"\x00" + bytes(color) * size
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(row * size))
+            + chunk(b"IEND", b""))
+
+
+NAMES = ["Alex Chen", "Maria Garcia", "Sam Okafor", "Priya Nair", "Jonas Berg", "Lea Rossi"]
+OCCUPATIONS = ["UX Designer", "Nurse", "Data Analyst", "Teacher", "Product Manager", "Chef"]
+GOALS = ["Ship accessible products", "Spend less time on paperwork", "Learn a new language",
+         "Grow a side business", "Run a marathon", "Automate reporting"]
+
+
+def make_persona():
+    """A random persona in the shape the Gemini prompt asks for"""
+    return {
+        "name": random.choice(NAMES),
+        "age": random.randint(18, 70),
+        "gender": random.choice(["Male", "Female", "Non-Binary", "Other"]),
+        "occupation": random.choice(OCCUPATIONS),
+        "location": random.choice(["Berlin", "Lagos", "Lima", "Pune", "Oslo"]),
+        "goals": random.choice(GOALS),
+        "frustrations": "Slow tools and too many meetings",
+        "motivations": "Making a difference for users",
+        "needs": "Reliable software that gets out of the way",
+        "skills": "Communication, spreadsheets",
+        "pain_points": "Switching between too many apps",
+        "tech_savviness": random.randint(1, 5),
+        "interests": random.sample(["Technology", "Design", "Music", "Sports",
+                                    "Reading", "Travel", "Gaming", "Fitness"], 2),
+        "platforms": random.sample(["Mobile", "Desktop", "Tablet", "Smartwatch", "VR/AR"], 2),
+    }
+
+
+def gemini_reply(prompt):
+    # Batch prompts ask for "N distinct ... personas" as a JSON array
+    match = re.search(r"Generate (\d+) distinct", prompt)
+    if match:
+        return json.dumps([make_persona() for _ in range(int(match.group(1)))])
+    return json.dumps(make_persona())
+
+
+def gemini_chunks(text, parts=3):
+    size = max(1, -(-len(text) // parts))
+    for start in range(0, len(text), size):
+        last = start + size >= len(text)
+        candidate = {"content": {"parts": [{"text": text[start:start + size]}], "role": "model"},
+                     "index": 0}
+        if last:
+            candidate["finishReason"] = "STOP"
+        yield {"candidates": [candidate]}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real services
+    disable_nagle_algorithm = True
+    latency = 0.0
+    error_rate = 0.0
+    loading_until = 0.0  # Hugging Face answers 503 with estimated_time until then
+    image = make_png()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _simulate(self):
+        if self.latency:
+            time.sleep(random.uniform(0.5, 1.5) * self.latency)
+        if random.random() < self.error_rate:
+            self._send(503, b'{"error": "stub failure"}', "application/json")
+            return False
+        return True
+
+    def do_GET(self):
+        if not self._simulate():
+            return
+        url = urlparse(self.path)
+        if url.path.rstrip("/") == "/api":
+            gender = parse_qs(url.query).get("gender", ["female"])[0].lower()
+            count = int(parse_qs(url.query).get("results", ["1"])[0])
+            host = self.headers.get("Host", "127.0.0.1")
+            results = [{"gender": gender,
+                        "picture": {"large": f"http://{host}/portraits/{random.randint(0, 99)}.png"}}
+                       for _ in range(count)]
+            self._send(200, json.dumps({"results": results}).encode(), "application/json")
+        elif url.path.startswith("/portraits/"):
+            self._send(200, self.image, "image/png")
+        else:
+            self._send(404, b"{}", "application/json")
+
+    def _gemini(self, url, body):
+        # REST transport of google.generativeai: a JSON array of responses, or SSE with alt=sse
+        try:
+            request = json.loads(body or b"{}")
+            prompt = " ".join(part.get("text", "") for content in request.get("contents", [])
+                              for part in content.get("parts", []))
+        except (ValueError, AttributeError):
+            prompt = ""
+        responses = list(gemini_chunks(gemini_reply(prompt)))
+        if ":streamGenerateContent" not in url.path:
+            text = "".join(r["candidates"][0]["content"]["parts"][0]["text"] for r in responses)
+            responses[-1]["candidates"][0]["content"]["parts"][0]["text"] = text
+            self._send(200, json.dumps(responses[-1]).encode(), "application/json")
+        elif "alt=sse" in url.query:
+            body = "".join(f"data: {json.dumps(r)}\r\n\r\n" for r in responses)
+            self._send(200, body.encode(), "text/event-stream")
+        else:
+            self._send(200, json.dumps(responses).encode(), "application/json")
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+        if not self._simulate():
+            return
+        url = urlparse(self.path)
+        if ":generateContent" in url.path or ":streamGenerateContent" in url.path:
+            self._gemini(url, body)
+            return
+        loading = self.loading_until - time.monotonic()
+        if self.path.startswith("/models/") and loading > 0:
+            body = json.dumps({"error": "Model is currently loading", "estimated_time": loading})
+            self._send(503, body.encode(), "application/json")
+        elif self.path.startswith("/models/") or self.path.startswith("/v2beta/"):
+            self._send(200, self.image, "image/png")
+        else:
+            self._send(404, b"{}", "application/json")
+
+
+def serve(host="127.0.0.1", port=8765, latency_ms=0, error_rate=0.0, model_loading=0.0):
+    StubHandler.latency = latency_ms / 1000
+    StubHandler.error_rate = error_rate
+    StubHandler.loading_until = time.monotonic() + model_loading
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0, help="Mean response latency in ms")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 503")
+    parser.add_argument("--model-loading", type=float, default=0.0,
+                        help="Seconds the Hugging Face model pretends to load after startup")
+    args = parser.parse_args()
+
+    server = serve(args.host, args.port, args.latency, args.error_rate, args.model_loading)
+    print(f"Stub services listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()